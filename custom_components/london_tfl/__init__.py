@@ -1,12 +1,13 @@
 import asyncio
 import logging
 
+import homeassistant.helpers.config_validation as cv
 from homeassistant import config_entries, core
 from homeassistant.const import Platform
-import homeassistant.helpers.config_validation as cv
 
 from .const import CONF_STOPS, DOMAIN
-
+from .network import async_close_session, async_refresh_ldbws_wsdl
+from .timetable import async_setup_timetable_store
 
 PLATFORMS = [Platform.SENSOR]
 
@@ -37,6 +38,18 @@ async def async_setup_entry(
 
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
     hass.data.setdefault(DOMAIN, {})
+    # Stored timetables let sensors start without downloading them again.
+    await async_setup_timetable_store(hass)
+
+    async def _async_refresh_ldbws_wsdl(call: core.ServiceCall) -> None:
+        await async_refresh_ldbws_wsdl(hass)
+        # Pooled clients keep their old definition, so rebuild them.
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            await hass.config_entries.async_reload(entry.entry_id)
+
+    hass.services.async_register(
+        DOMAIN, "refresh_ldbws_wsdl", _async_refresh_ldbws_wsdl
+    )
     return True
 
 
@@ -62,5 +75,8 @@ async def async_unload_entry(
     # Remove config entry from domain.
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
+        # The pooled HTTP session is shared by all entries; close it with the last one.
+        if not hass.data[DOMAIN]:
+            await async_close_session(hass)
 
     return unload_ok
@@ -0,0 +1,155 @@
+"""
+Cached TfL line and stop point catalogue used by the config and options flows.
+
+Line lists per mode and stop point lists per line change rarely but can be
+megabytes of JSON, so each is fetched once, projected to an id -> name map
+and kept for CATALOGUE_TTL, persisted with Home Assistant's storage helper.
+If TfL cannot be reached an expired copy is still served. Every stop point
+list seen is also added to a StopIndex for the flows' search step.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable
+
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DATA_CATALOGUE,
+    DEFAULT_METHODS,
+    DOMAIN,
+    TFL_LINES_URL,
+    TFL_STATIONS_URL,
+)
+from .decode import async_decode, loads
+from .network import get_session, request
+from .ratelimit import PRIORITY_CATALOGUE
+from .stop_index import StopIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+CATALOGUE_TTL = 24 * 3600
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.catalogue"
+STORAGE_SAVE_DELAY = 30
+
+
+def parse_lines(data: list) -> dict[str, str]:
+    return {item["id"]: item["name"] for item in data}
+
+
+def parse_stations(data: list, method: str) -> dict[str, str]:
+    if method != "bus":
+        return {item["stationNaptan"]: item["commonName"] for item in data}
+    # Many bus stops share a name; the indicator (e.g. "Stop K") tells them apart.
+    return {
+        item["id"]: (
+            f"{item['commonName']} ({item['indicator']})"
+            if item.get("indicator")
+            else item["commonName"]
+        )
+        for item in data
+    }
+
+
+class Catalogue:
+    """Line and stop point names, keyed by mode and line."""
+
+    def __init__(self, hass) -> None:
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._entries: dict[str, dict] = {}
+        self.stops = StopIndex()
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or {}
+        # Expired entries are kept: they are still better than nothing when TfL is down.
+        self._entries = data.get("entries", {})
+        for key, entry in self._entries.items():
+            if key.startswith("stations/"):
+                _, method, line = key.split("/", 2)
+                self.stops.add(method, line, entry["items"])
+
+    def _data_to_save(self) -> dict:
+        return {"entries": self._entries}
+
+    async def _get(
+        self,
+        key: str,
+        url: str,
+        parse: Callable[[list], dict[str, str]],
+        app_key: str | None,
+    ) -> dict[str, str]:
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry["fetched"] < CATALOGUE_TTL:
+            return entry["items"]
+
+        items = None
+        try:
+            result = await request(
+                url,
+                session=get_session(self._hass),
+                priority=PRIORITY_CATALOGUE,
+                app_key=app_key,
+            )
+            if not result:
+                _LOGGER.warning("There was no reply from TfL servers for %s", url)
+            else:
+                items = parse(await async_decode(self._hass, result, loads))
+        except Exception:
+            _LOGGER.warning("Failed to fetch %s", url, exc_info=True)
+
+        if not items:
+            if entry is not None:
+                _LOGGER.debug("Serving expired catalogue entry %s", key)
+                return entry["items"]
+            return {}
+
+        self._entries[key] = {"fetched": time.time(), "items": items}
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+        return items
+
+    async def async_lines(
+        self, method: str, app_key: str | None = None
+    ) -> dict[str, str]:
+        """Return {line id: name} for a mode; empty if unavailable."""
+        return await self._get(
+            f"lines/{method}", TFL_LINES_URL.format(method), parse_lines, app_key
+        )
+
+    async def async_stations(
+        self, method: str, line: str, app_key: str | None = None
+    ) -> dict[str, str]:
+        """Return {stop point id: name} for a line; empty if unavailable."""
+        stations = await self._get(
+            f"stations/{method}/{line}",
+            TFL_STATIONS_URL.format(line),
+            lambda data: parse_stations(data, method),
+            app_key,
+        )
+        if stations:
+            self.stops.add(method, line, stations)
+        return stations
+
+    async def async_prefetch(self, app_key: str | None = None) -> None:
+        """Fill the line lists of every mode, e.g. while the user picks one."""
+        for method in DEFAULT_METHODS:
+            await self.async_lines(method, app_key)
+
+    def async_start_prefetch(self, app_key: str | None = None) -> None:
+        self._hass.async_create_background_task(
+            self.async_prefetch(app_key), f"{DOMAIN} catalogue prefetch"
+        )
+
+
+async def async_get_catalogue(hass) -> Catalogue:
+    """Return the shared catalogue, loading it from storage on first use."""
+    catalogue = hass.data.get(DATA_CATALOGUE)
+    if catalogue is None:
+        catalogue = Catalogue(hass)
+        await catalogue.async_load()
+        catalogue = hass.data.setdefault(DATA_CATALOGUE, catalogue)
+    return catalogue
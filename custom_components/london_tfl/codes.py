@@ -5,25 +5,39 @@ ATCO codes for National Rail stations:
   <3-digit area code><0 or G><TIPLOC>
 e.g. 910GKNGX → TIPLOC KNGX, CRS KGX
 
-CRS codes are fetched from railwaycodes.org.uk (the same source pyrcs scrapes)
-but per-letter rather than bulk, which avoids pyrcs's aggregation bug.
-Each letter page is fetched once and cached for the process lifetime.
+CRS codes are fetched from railwaycodes.org.uk (the same source
+pyrcs scrapes) but per-letter rather than bulk, which avoids pyrcs's
+aggregation bug. Letter pages and resolved codes are kept per Home
+Assistant instance in hass.data and persisted with its storage helper for
+CACHE_TTL; failures and unknown codes are only remembered briefly, so a
+transient outage is retried.
 """
 
+import asyncio
 import html.parser
 import json
 import logging
+import time
 
 import aiohttp
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_CRS_CODES, DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
 _RWC_URL = "http://www.railwaycodes.org.uk/crs/crs{}.shtm"
 _TFL_STOPPOINT_URL = "https://api.tfl.gov.uk/StopPoint/{}"
 
-_letter_cache: dict[str, dict[str, str]] = {}
-_crs_cache: dict[str, str] = {}
-
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.crs_codes"
+STORAGE_SAVE_DELAY = 30
+# Resolved codes and letter pages rarely change.
+CACHE_TTL = 30 * 24 * 3600
+# A letter page that failed to load is not requested again for this long.
+LETTER_RETRY = 5 * 60
+# An ATCO code that could not be resolved is not looked up again for this long.
+NEGATIVE_TTL = 15 * 60
 
 class _TableParser(html.parser.HTMLParser):
     def __init__(self):
@@ -87,24 +101,35 @@ def _parse_letter_page(html_content: str) -> dict[str, str]:
     return {}
 
 
-async def _load_letter(letter: str) -> dict[str, str]:
+async def _load_letter(hass, letter: str) -> dict[str, str] | None:
+    """Fetch and parse a letter page; None if it could not be loaded."""
+    from custom_components.london_tfl.network import get_session
+
     url = _RWC_URL.format(letter.lower())
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={"User-Agent": "HA-LondonTfL/1.0 (https://github.com/morosanmihail/HA-LondonTfL)"},
-                timeout=aiohttp.ClientTimeout(total=15),
-            ) as resp:
-                if resp.status != 200:
-                    _LOGGER.warning("railwaycodes.org.uk returned HTTP %s for letter %s", resp.status, letter)
-                    return {}
-                html_content = await resp.text(errors="replace")
+        async with get_session(hass).get(
+            url,
+            headers={"User-Agent": "HA-LondonTfL/1.0 (https://github.com/morosanmihail/HA-LondonTfL)"},
+            timeout=aiohttp.ClientTimeout(total=15),
+        ) as resp:
+            if resp.status != 200:
+                _LOGGER.warning(
+                    "railwaycodes.org.uk returned HTTP %s for letter %s",
+                    resp.status,
+                    letter,
+                )
+                return None
+            html_content = await resp.text(errors="replace")
     except Exception as e:
         _LOGGER.warning("Failed to fetch railwaycodes.org.uk for letter %s: %s", letter, e)
-        return {}
+        return None
 
     result = _parse_letter_page(html_content)
+    if not result:
+        _LOGGER.warning(
+            "No TIPLOC→CRS table found on railwaycodes.org.uk for letter %s", letter
+        )
+        return None
     _LOGGER.debug("Loaded %d TIPLOC→CRS entries for letter %s", len(result), letter.upper())
     return result
 
@@ -124,10 +149,15 @@ def atco_to_tiploc(atco: str) -> str:
     return atco[4:]
 
 
-async def _tfl_api_crs(atco: str) -> str | None:
-    from custom_components.london_tfl.network import request
+async def _tfl_api_crs(hass, atco: str) -> str | None:
+    from custom_components.london_tfl.network import get_session, request
+    from custom_components.london_tfl.ratelimit import PRIORITY_CATALOGUE
 
-    response = await request(_TFL_STOPPOINT_URL.format(atco))
+    response = await request(
+        _TFL_STOPPOINT_URL.format(atco),
+        session=get_session(hass),
+        priority=PRIORITY_CATALOGUE,
+    )
     if response is None:
         return None
     try:
@@ -140,30 +170,142 @@ async def _tfl_api_crs(atco: str) -> str | None:
     return None
 
 
-async def atco_to_crs(hass, atco: str) -> str:
-    """
-    Returns the CRS code for a given ATCO code.
-    Raises ValueError if no CRS code can be found.
-    """
-    if atco in _crs_cache:
-        return _crs_cache[atco]
+class CrsCodes:
+    """CRS codes resolved for ATCO codes, and the letter pages they came from."""
+
+    def __init__(self, hass) -> None:
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        # Letter -> (fetched, {TIPLOC: CRS});
+        # ATCO -> (resolved, CRS or None when not found).
+        self._letters: dict[str, tuple[float, dict[str, str]]] = {}
+        self._crs: dict[str, tuple[float, str | None]] = {}
+        self._letter_failures: dict[str, float] = {}
+        self._letter_locks: dict[str, asyncio.Lock] = {}
+        self._atco_locks: dict[str, asyncio.Lock] = {}
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or {}
+        now = time.time()
+        for letter, entry in data.get("letters", {}).items():
+            if now - entry["fetched"] < CACHE_TTL:
+                self._letters[letter] = (entry["fetched"], entry["codes"])
+        for atco, entry in data.get("crs", {}).items():
+            if now - entry["resolved"] < CACHE_TTL:
+                self._crs[atco] = (entry["resolved"], entry["crs"])
+
+    def _data_to_save(self) -> dict:
+        return {
+            "letters": {
+                letter: {"fetched": fetched, "codes": codes}
+                for letter, (fetched, codes) in self._letters.items()
+            },
+            # Only successful resolutions outlive a restart.
+            "crs": {
+                atco: {"resolved": resolved, "crs": crs}
+                for atco, (resolved, crs) in self._crs.items()
+                if crs is not None
+            },
+        }
+
+    def _save(self) -> None:
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _cached_crs(self, atco: str) -> tuple[bool, str | None]:
+        """Return (hit, crs); a hit with crs None is a remembered failure."""
+        entry = self._crs.get(atco)
+        if entry is None:
+            return False, None
+        resolved, crs = entry
+        ttl = CACHE_TTL if crs is not None else NEGATIVE_TTL
+        if time.time() - resolved >= ttl:
+            del self._crs[atco]
+            return False, None
+        return True, crs
 
-    tiploc = atco_to_tiploc(atco)
-    letter = tiploc[0].upper()
+    def _remember_crs(self, atco: str, crs: str | None) -> None:
+        self._crs[atco] = (time.time(), crs)
+        if crs is not None:
+            self._save()
 
-    if letter not in _letter_cache:
-        _letter_cache[letter] = await _load_letter(letter)
+    async def _letter_codes(self, letter: str) -> dict[str, str]:
+        """Return {TIPLOC: CRS} for letter, loading each page once at a time."""
+        async with self._letter_locks.setdefault(letter, asyncio.Lock()):
+            now = time.time()
+            entry = self._letters.get(letter)
+            if entry is not None and now - entry[0] < CACHE_TTL:
+                return entry[1]
+            failed = self._letter_failures.get(letter)
+            if failed is not None and now - failed < LETTER_RETRY:
+                return {}
 
-    if tiploc in _letter_cache[letter]:
-        crs = _letter_cache[letter][tiploc]
-        _crs_cache[atco] = crs
-        _LOGGER.debug("Resolved %s → %s → %s via railwaycodes.org.uk", atco, tiploc, crs)
-        return crs
+            codes = await _load_letter(self._hass, letter)
+            if codes is None:
+                self._letter_failures[letter] = time.time()
+                return {}
+            self._letter_failures.pop(letter, None)
+            self._letters[letter] = (time.time(), codes)
+            self._save()
+            return codes
 
-    crs = await _tfl_api_crs(atco)
-    if crs:
-        _crs_cache[atco] = crs
-        _LOGGER.debug("Resolved %s → %s via TfL API fallback", atco, crs)
-        return crs
+    async def async_resolve(self, atco: str) -> str:
+        """
+        Returns the CRS code for a given ATCO code.
+        Raises ValueError if no CRS code can be found.
+        """
+        hass = self._hass
+        # Concurrent lookups of one station wait for a single resolution.
+        async with self._atco_locks.setdefault(atco, asyncio.Lock()):
+            hit, crs = self._cached_crs(atco)
+            if hit:
+                if crs is None:
+                    raise ValueError(f"No CRS code found for ATCO {atco!r} (cached)")
+                return crs
 
-    raise ValueError(f"No CRS code found for ATCO {atco!r} (TIPLOC {tiploc!r})")
+            tiploc = atco_to_tiploc(atco)
+            letter_codes = await self._letter_codes(tiploc[0].upper())
+            if tiploc in letter_codes:
+                crs = letter_codes[tiploc]
+                self._remember_crs(atco, crs)
+                _LOGGER.debug(
+                    "Resolved %s → %s → %s via railwaycodes.org.uk", atco, tiploc, crs
+                )
+                return crs
+
+            crs = await _tfl_api_crs(hass, atco)
+            if crs:
+                self._remember_crs(atco, crs)
+                _LOGGER.debug("Resolved %s → %s via TfL API fallback", atco, crs)
+                return crs
+
+            self._remember_crs(atco, None)
+            raise ValueError(f"No CRS code found for ATCO {atco!r} (TIPLOC {tiploc!r})")
+
+
+async def _async_load_crs_codes(hass) -> CrsCodes:
+    crs_codes = CrsCodes(hass)
+    await crs_codes.async_load()
+    return crs_codes
+
+
+async def async_get_crs_codes(hass) -> CrsCodes:
+    """Return the CRS codes of this hass, loading them from storage on first use.
+
+    Callers arriving while they load all wait for the same load.
+    """
+    task = hass.data.get(DATA_CRS_CODES)
+    if task is None:
+        task = hass.data[DATA_CRS_CODES] = hass.async_create_task(
+            _async_load_crs_codes(hass)
+        )
+    # Shield so that one caller being cancelled does not cancel the load for the others.
+    return await asyncio.shield(task)
+
+
+async def atco_to_crs(hass, atco: str) -> str:
+    """
+    Returns the CRS code for a given ATCO code.
+    Raises ValueError if no CRS code can be found.
+    """
+    crs_codes = await async_get_crs_codes(hass)
+    return await crs_codes.async_resolve(atco)
@@ -1,29 +1,32 @@
 import logging
-import json
 from typing import Any
 
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.helpers import selector
-import homeassistant.helpers.config_validation as cv
-import voluptuous as vol
 
+from .catalogue import async_get_catalogue
 from .const import (
-    CONF_STOPS,
-    CONF_STATION,
+    ATTRIBUTE_FORMATS,
+    CONF_ATTRIBUTE_FORMATS,
+    CONF_CACHE_BUSTER,
     CONF_LINE,
-    CONF_METHOD,
-    CONF_SHORTEN_STATION_NAMES,
     CONF_MAX,
+    CONF_METHOD,
     CONF_NR_API_KEY,
     CONF_PLATFORM,
+    CONF_SHORTEN_STATION_NAMES,
+    CONF_STATION,
+    CONF_STOPS,
+    CONF_TFL_APP_KEY,
+    DEFAULT_ATTRIBUTE_FORMATS,
     DEFAULT_MAX,
     DEFAULT_METHODS,
     DOMAIN,
-    TFL_LINES_URL,
-    TFL_STATIONS_URL,
 )
-from .network import request
+from .stop_index import SEARCH_THRESHOLD
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -39,6 +42,8 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             "lastLine": "",
             "lastMethod": "",
         }
+        # Stations matching the last search, shown instead of the whole line.
+        self._station_matches: dict[str, str] | None = None
 
     @staticmethod
     @callback
@@ -51,13 +56,26 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         errors: dict[str, str] = {}
         if user_input is not None:
             self.data["lastMethod"] = user_input[CONF_METHOD]
+            if user_input.get(CONF_TFL_APP_KEY):
+                self.data[CONF_TFL_APP_KEY] = user_input[CONF_TFL_APP_KEY]
             return await self.async_step_lines()
 
+        # Warm the line lists while the user picks a mode.
+        (await async_get_catalogue(self.hass)).async_start_prefetch(
+            self.data.get(CONF_TFL_APP_KEY)
+        )
+
+        extra_fields = {}
+        if not self.data[CONF_STOPS]:
+            # The app key applies to the whole entry, so only ask for it once.
+            extra_fields[vol.Optional(CONF_TFL_APP_KEY)] = cv.string
+
         return self.async_show_form(
             step_id="user",
             data_schema=vol.Schema(
                 {
                     vol.Required(CONF_METHOD): vol.In(DEFAULT_METHODS),
+                    **extra_fields,
                 }
             ),
             errors=errors,
@@ -69,17 +87,10 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             self.data["lastLine"] = user_input[CONF_LINE]
             return await self.async_step_station()
 
-        lines = {}
-        try:
-            url_base = TFL_LINES_URL.format(self.data["lastMethod"])
-            result = await request(url_base)
-            if not result:
-                _LOGGER.warning("There was no reply from TfL servers.")
-            else:
-                lines = {item["id"]: item["name"] for item in json.loads(result)}
-        except Exception:
-            _LOGGER.warning("Failed to fetch lines", exc_info=True)
-
+        catalogue = await async_get_catalogue(self.hass)
+        lines = await catalogue.async_lines(
+            self.data["lastMethod"], self.data.get(CONF_TFL_APP_KEY)
+        )
         if not lines:
             return self.async_abort(reason="cannot_connect")
 
@@ -93,9 +104,30 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors,
         )
 
+    async def async_step_station_search(self, user_input: dict[str, Any] | None = None):
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            catalogue = await async_get_catalogue(self.hass)
+            matches = catalogue.stops.search(
+                user_input["search"],
+                method=self.data["lastMethod"],
+                line=self.data["lastLine"],
+            )
+            if matches:
+                self._station_matches = matches
+                return await self.async_step_station()
+            errors["search"] = "no_matches"
+
+        return self.async_show_form(
+            step_id="station_search",
+            data_schema=vol.Schema({vol.Required("search"): cv.string}),
+            errors=errors,
+        )
+
     async def async_step_station(self, user_input: dict[str, Any] | None = None):
         errors: dict[str, str] = {}
         if user_input is not None:
+            self._station_matches = None
             self.data[CONF_STOPS].append(
                 {
                     CONF_LINE: self.data["lastLine"],
@@ -105,6 +137,10 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     CONF_MAX: user_input[CONF_MAX],
                     CONF_PLATFORM: user_input[CONF_PLATFORM],
                     CONF_SHORTEN_STATION_NAMES: user_input[CONF_SHORTEN_STATION_NAMES],
+                    CONF_CACHE_BUSTER: user_input.get(CONF_CACHE_BUSTER, False),
+                    CONF_ATTRIBUTE_FORMATS: user_input.get(
+                        CONF_ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMATS
+                    ),
                 }
             )
             if user_input.get("add_another", False):
@@ -114,24 +150,18 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 title=user_input[CONF_STATION], data=self.data
             )
 
-        stations_url = TFL_STATIONS_URL.format(self.data["lastLine"])
-
-        stations = {}
-        try:
-            result = await request(stations_url)
-            if not result:
-                _LOGGER.warning("There was no reply from TfL servers.")
-            else:
-                data = json.loads(result)
-                if self.data["lastMethod"] != "bus":
-                    stations = {item["stationNaptan"]: item["commonName"] for item in data}
-                else:
-                    stations = {item["id"]: item["commonName"] for item in data}
-        except Exception:
-            _LOGGER.warning("Failed to fetch stations", exc_info=True)
-
+        catalogue = await async_get_catalogue(self.hass)
+        stations = await catalogue.async_stations(
+            self.data["lastMethod"],
+            self.data["lastLine"],
+            self.data.get(CONF_TFL_APP_KEY),
+        )
         if not stations:
             return self.async_abort(reason="cannot_connect")
+        if self._station_matches is not None:
+            stations = self._station_matches
+        elif len(stations) > SEARCH_THRESHOLD:
+            return await self.async_step_station_search()
 
         extra_fields = {}
 
@@ -157,6 +187,10 @@ class LondonTfLConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     vol.Optional(CONF_SHORTEN_STATION_NAMES, default=False): cv.boolean,
                     vol.Optional(CONF_MAX, default=DEFAULT_MAX): cv.positive_int,
                     vol.Optional(CONF_PLATFORM, default=""): cv.string,
+                    vol.Optional(CONF_CACHE_BUSTER, default=False): cv.boolean,
+                    vol.Optional(
+                        CONF_ATTRIBUTE_FORMATS, default=DEFAULT_ATTRIBUTE_FORMATS
+                    ): cv.multi_select(ATTRIBUTE_FORMATS),
                     vol.Optional("add_another", default=False): cv.boolean,
                 }
             ),
@@ -181,6 +215,8 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         self._editing_index: int | None = None
         # Cached station name map populated when showing the add-station form.
         self._current_stations: dict[str, str] = {}
+        # Stations matching the last search, shown instead of the whole line.
+        self._station_matches: dict[str, str] | None = None
 
     def _stop_label(self, stop: dict[str, Any]) -> str:
         """Return a human-readable label for a stop."""
@@ -196,6 +232,9 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
 
     async def async_step_init(self, user_input: dict[str, Any] | None = None):
         """Show the top-level menu, hiding edit/remove when no stops exist."""
+        (await async_get_catalogue(self.hass)).async_start_prefetch(
+            self._config_entry.data.get(CONF_TFL_APP_KEY)
+        )
         menu_options: list[str] = ["add_stop"]
         if self._stops:
             menu_options += ["edit_stop", "remove_stop"]
@@ -225,21 +264,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             self._last_line = user_input[CONF_LINE]
             return await self.async_step_add_station()
 
-        lines = {}
-        try:
-            result = await request(TFL_LINES_URL.format(self._last_method))
-            if not result:
-                _LOGGER.warning(
-                    "No reply from TfL when fetching lines for method %s",
-                    self._last_method,
-                )
-            else:
-                lines = {item["id"]: item["name"] for item in json.loads(result)}
-        except Exception:
-            _LOGGER.warning(
-                "Failed to fetch lines for method %s", self._last_method, exc_info=True
-            )
-
+        catalogue = await async_get_catalogue(self.hass)
+        lines = await catalogue.async_lines(
+            self._last_method, self._config_entry.data.get(CONF_TFL_APP_KEY)
+        )
         if not lines:
             return self.async_abort(reason="cannot_connect")
 
@@ -249,6 +277,27 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             errors=errors,
         )
 
+    async def async_step_add_station_search(
+        self, user_input: dict[str, Any] | None = None
+    ):
+        """Step 3a of adding a stop on a long line: search for the station."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            catalogue = await async_get_catalogue(self.hass)
+            matches = catalogue.stops.search(
+                user_input["search"], method=self._last_method, line=self._last_line
+            )
+            if matches:
+                self._station_matches = matches
+                return await self.async_step_add_station()
+            errors["search"] = "no_matches"
+
+        return self.async_show_form(
+            step_id="add_station_search",
+            data_schema=vol.Schema({vol.Required("search"): cv.string}),
+            errors=errors,
+        )
+
     async def async_step_add_station(self, user_input: dict[str, Any] | None = None):
         """Step 3 of adding a stop: pick the station and set options."""
         if user_input is not None:
@@ -261,6 +310,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     CONF_MAX: user_input[CONF_MAX],
                     CONF_PLATFORM: user_input[CONF_PLATFORM],
                     CONF_SHORTEN_STATION_NAMES: user_input[CONF_SHORTEN_STATION_NAMES],
+                    CONF_CACHE_BUSTER: user_input.get(CONF_CACHE_BUSTER, False),
+                    CONF_ATTRIBUTE_FORMATS: user_input.get(
+                        CONF_ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMATS
+                    ),
                     # Store display name so the edit/remove UI shows it without an API call.
                     "station_display_name": self._current_stations.get(
                         user_input[CONF_STATION], ""
@@ -270,31 +323,18 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             return self._save()
 
         errors: dict[str, str] = {}
-        self._current_stations = {}
-        try:
-            result = await request(TFL_STATIONS_URL.format(self._last_line))
-            if not result:
-                _LOGGER.warning(
-                    "No reply from TfL when fetching stations for line %s",
-                    self._last_line,
-                )
-            else:
-                data = json.loads(result)
-                if self._last_method != "bus":
-                    self._current_stations = {
-                        item["stationNaptan"]: item["commonName"] for item in data
-                    }
-                else:
-                    self._current_stations = {
-                        item["id"]: item["commonName"] for item in data
-                    }
-        except Exception:
-            _LOGGER.warning(
-                "Failed to fetch stations for line %s", self._last_line, exc_info=True
-            )
-
+        catalogue = await async_get_catalogue(self.hass)
+        self._current_stations = await catalogue.async_stations(
+            self._last_method,
+            self._last_line,
+            self._config_entry.data.get(CONF_TFL_APP_KEY),
+        )
         if not self._current_stations:
             return self.async_abort(reason="cannot_connect")
+        if self._station_matches is not None:
+            self._current_stations = self._station_matches
+        elif len(self._current_stations) > SEARCH_THRESHOLD:
+            return await self.async_step_add_station_search()
 
         extra_fields: dict = {}
         if self._last_method == "national-rail" and self._last_line != "thameslink":
@@ -315,6 +355,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     vol.Optional(CONF_SHORTEN_STATION_NAMES, default=False): cv.boolean,
                     vol.Optional(CONF_MAX, default=DEFAULT_MAX): cv.positive_int,
                     vol.Optional(CONF_PLATFORM, default=""): cv.string,
+                    vol.Optional(CONF_CACHE_BUSTER, default=False): cv.boolean,
+                    vol.Optional(
+                        CONF_ATTRIBUTE_FORMATS, default=DEFAULT_ATTRIBUTE_FORMATS
+                    ): cv.multi_select(ATTRIBUTE_FORMATS),
                 }
             ),
             errors=errors,
@@ -351,6 +395,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 CONF_MAX: user_input[CONF_MAX],
                 CONF_PLATFORM: user_input[CONF_PLATFORM],
                 CONF_SHORTEN_STATION_NAMES: user_input[CONF_SHORTEN_STATION_NAMES],
+                CONF_CACHE_BUSTER: user_input.get(CONF_CACHE_BUSTER, False),
+                CONF_ATTRIBUTE_FORMATS: user_input.get(
+                    CONF_ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMATS
+                ),
             }
             return self._save()
 
@@ -380,6 +428,15 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     vol.Optional(
                         CONF_PLATFORM, default=stop.get(CONF_PLATFORM, "")
                     ): cv.string,
+                    vol.Optional(
+                        CONF_CACHE_BUSTER, default=stop.get(CONF_CACHE_BUSTER, False)
+                    ): cv.boolean,
+                    vol.Optional(
+                        CONF_ATTRIBUTE_FORMATS,
+                        default=stop.get(
+                            CONF_ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMATS
+                        ),
+                    ): cv.multi_select(ATTRIBUTE_FORMATS),
                 }
             ),
         )
@@ -1,4 +1,9 @@
 DOMAIN = "london_tfl"
+DATA_SESSION = f"{DOMAIN}_session"
+DATA_TIMETABLES = f"{DOMAIN}_timetables"
+DATA_CATALOGUE = f"{DOMAIN}_catalogue"
+DATA_FEEDS = f"{DOMAIN}_feeds"
+DATA_CRS_CODES = f"{DOMAIN}_crs_codes"
 
 DEFAULT_NAME = "London TfL"
 CONF_STOPS = "stops"
@@ -7,9 +12,18 @@ CONF_LINE = "line"
 CONF_SHORTEN_STATION_NAMES = "shortenStationNames"
 CONF_STATION = "station"
 CONF_NR_API_KEY = "nr_api_key"
+CONF_TFL_APP_KEY = "tfl_app_key"
 CONF_PLATFORM = "platform"
 CONF_MAX = "max"
+CONF_CACHE_BUSTER = "cache_buster"
+CONF_ATTRIBUTE_FORMATS = "attribute_formats"
 DEFAULT_MAX = 3
+# Card formats a sensor can expose in its attributes.
+ATTRIBUTE_FORMATS = {
+    "hasl": "HASL departure card (departures)",
+    "upcoming_media": "Upcoming media card (data)",
+}
+DEFAULT_ATTRIBUTE_FORMATS = list(ATTRIBUTE_FORMATS)
 DEFAULT_LINES = {"dlr": "DLR", "jubilee": "Jubilee"}
 DEFAULT_METHODS = [
     "tube",
@@ -38,6 +52,8 @@ TFL_ALT_ARRIVALS_URL = (
     "https://api.tfl.gov.uk/StopPoint/{1}/arrivaldepartures/?lineIds={0}&test={2}"
 )
 TFL_BUS_ARRIVALS_URL = "https://api.tfl.gov.uk/StopPoint/{1}/arrivals/?test={2}"
+TFL_STATION_ARRIVALS_URL = "https://api.tfl.gov.uk/StopPoint/{1}/Arrivals?test={2}"
+TFL_LINE_ARRIVALS_URL = "https://api.tfl.gov.uk/Line/{0}/Arrivals?test={2}"
 TFL_STATIONS_URL = "https://api.tfl.gov.uk/line/{0}/stoppoints"
 TFL_TIMETABLE_URL = "https://api.tfl.gov.uk/Line/{0}/Timetable/{1}"
 USE_LDBWS_URL = "use-ldbws-purposefully-not-a-url"
@@ -0,0 +1,157 @@
+"""Per-stop update coordinator shared by the realtime/scheduled/all sensors."""
+
+from __future__ import annotations
+
+import inspect
+import logging
+import time
+from datetime import timedelta
+from typing import Any
+
+from homeassistant import config_entries, core
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import DOMAIN
+from .feeds import get_feeds
+from .tfl_data import TfLData, scheduled_only
+
+_LOGGER = logging.getLogger(__name__)
+SCAN_INTERVAL = timedelta(minutes=1)
+# Bounds for the adaptive polling interval.
+IMMINENT_INTERVAL = timedelta(seconds=30)
+MAX_INTERVAL = timedelta(minutes=5)
+NO_SERVICE_INTERVAL = timedelta(minutes=30)
+
+DEPARTURE_MODES = ("realtime", "scheduled", "all")
+
+# DataUpdateCoordinator only takes config_entry from Home Assistant 2024.11.
+_TAKES_CONFIG_ENTRY = (
+    "config_entry" in inspect.signature(DataUpdateCoordinator.__init__).parameters
+)
+
+
+def stop_key(
+    method: str, line: str, station: str, platform_filter: str, max_items: int
+) -> tuple:
+    """Return the key identifying a stop; stops with equal keys share a coordinator."""
+    return (
+        method,
+        line,
+        station,
+        platform_filter.strip() if platform_filter else "",
+        int(max_items),
+    )
+
+
+def next_poll_interval(
+    now: float,
+    next_arrival: float | None,
+    next_scheduled: float | None,
+    has_timetable: bool,
+) -> timedelta:
+    """Pick how long to wait before polling a stop again.
+
+    Polls quickly when a departure is imminent, backs off while predictions
+    are far out, and mostly pauses when the timetable shows no service soon.
+    """
+    if next_arrival is not None:
+        wait = next_arrival - now
+        if wait <= 5 * 60:
+            return IMMINENT_INTERVAL
+        if wait <= 20 * 60:
+            return SCAN_INTERVAL
+        # Poll again about 20 minutes before the first prediction is due.
+        seconds = wait - 20 * 60
+        return max(SCAN_INTERVAL, min(MAX_INTERVAL, timedelta(seconds=seconds)))
+
+    if not has_timetable:
+        # Without a timetable an empty board may just be a gap, keep the default.
+        return SCAN_INTERVAL
+    if next_scheduled is None:
+        return NO_SERVICE_INTERVAL
+    # Nothing predicted yet: wake up shortly before the next timetabled departure.
+    seconds = next_scheduled - now - 30 * 60
+    return max(SCAN_INTERVAL, min(NO_SERVICE_INTERVAL, timedelta(seconds=seconds)))
+
+
+class LondonTfLCoordinator(DataUpdateCoordinator[dict[str, Any]]):
+    """Runs one fetch, timetable check and departure computation per tick for a stop.
+
+    The polling interval adapts after every tick, see next_poll_interval.
+
+    The result is a dict with an ``error`` string (None on success) and the
+    departures computed for every mode the stop exposes.
+    """
+
+    def __init__(
+        self,
+        hass: core.HomeAssistant,
+        tfl_data: TfLData,
+        *,
+        platform_filter: str,
+        max_items: int,
+        config_entry: config_entries.ConfigEntry | None = None,
+    ) -> None:
+        kwargs = {"config_entry": config_entry} if _TAKES_CONFIG_ENTRY else {}
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} {tfl_data.line} {tfl_data.station}",
+            update_interval=SCAN_INTERVAL,
+            **kwargs,
+        )
+        if not _TAKES_CONFIG_ENTRY and config_entry is not None:
+            # Older versions only read the entry currently being set up.
+            self.config_entry = config_entry
+        self.tfl_data = tfl_data
+        self.filter_platform = platform_filter.strip() if platform_filter else ""
+        self.max_items = int(max_items)
+        # Stops that can share a request with others are served by a feed.
+        get_feeds(hass).register(tfl_data)
+
+    @property
+    def departure_modes(self) -> tuple[str, ...]:
+        """Departure modes served for this stop; National Rail has no timetable."""
+        if self.tfl_data.method == "national-rail":
+            return ("realtime",)
+        return DEPARTURE_MODES
+
+    async def _async_update_data(self) -> dict[str, Any]:
+        tfl_data = self.tfl_data
+        previous = self.data["departures"] if self.data else {}
+
+        if tfl_data.is_data_stale(self.max_items):
+            result = await tfl_data.fetch(self.hass)
+            if isinstance(result, str):
+                self.update_interval = SCAN_INTERVAL
+                # Keep the last known departures so attributes survive a failed poll.
+                return {"error": result, "departures": previous}
+            tfl_data.populate(result, self.filter_platform)
+
+        await tfl_data.fetch_timetable(self.hass)
+
+        tfl_data.sort_data(self.max_items)
+        departures = {"realtime": tfl_data.get_departures("realtime")}
+        if "all" in self.departure_modes:
+            # "scheduled" is a subset of "all", so compute the merge only once.
+            departures["all"] = tfl_data.get_departures("all")
+            departures["scheduled"] = scheduled_only(departures["all"])
+
+        self.update_interval = next_poll_interval(
+            time.time(),
+            tfl_data.next_arrival(),
+            tfl_data.next_scheduled_departure(),
+            tfl_data.has_timetable(),
+        )
+        return {"error": None, "departures": departures}
+
+    async def async_shutdown(self) -> None:
+        """Stop polling and release the stop's shared clients."""
+        await super().async_shutdown()
+        get_feeds(self.hass).unregister(self.tfl_data)
+        await self.tfl_data.async_close()
+
+    async def async_force_timetable_refresh(self) -> None:
+        """Force-refresh the timetable and recompute departures for every sensor."""
+        await self.tfl_data.fetch_timetable(self.hass, force=True)
+        await self.async_refresh()
@@ -0,0 +1,115 @@
+"""
+JSON decoding for TfL responses.
+
+Uses orjson when it is installed (Home Assistant ships it) and json
+otherwise. Arrival and timetable responses are projected to the fields the
+integration reads right after decoding, so the full response tree is not
+kept around, and large bodies are decoded in an executor to keep the event
+loop free.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable, Iterable
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is a Home Assistant dependency
+    orjson = None
+
+# Bodies larger than this many characters are decoded in an executor.
+EXECUTOR_THRESHOLD = 256 * 1024
+
+# Arrival fields read whatever the transport type, see tfl_data.get_destination.
+COMMON_ARRIVAL_FIELDS = ("destinationName", "towards", "stationName")
+
+
+def loads(text: str | bytes) -> Any:
+    """Decode JSON; raises ValueError (json.JSONDecodeError) on bad input."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def arrival_fields(transport_type: dict) -> tuple[str, ...]:
+    """Return the arrival fields read for a TFL_TRANSPORT_TYPES entry."""
+    fields = dict.fromkeys(COMMON_ARRIVAL_FIELDS)
+    for key in ("expected_departure", "expected_arrival", "platform_name"):
+        fields[transport_type[key]] = None
+    return tuple(fields)
+
+
+def project(items: Iterable, fields: Iterable[str]) -> list[dict]:
+    """Keep only fields of each dict in items, dropping anything that is not a dict."""
+    fields = tuple(fields)
+    return [
+        {key: item[key] for key in fields if key in item}
+        for item in items
+        if isinstance(item, dict)
+    ]
+
+
+def decode_arrivals(text: str | bytes, fields: Iterable[str]) -> list[dict]:
+    """Decode an arrivals response, keeping only fields of each prediction."""
+    data = loads(text)
+    if not isinstance(data, list):
+        raise ValueError(f"expected a list of arrivals, got {type(data).__name__}")
+    return project(data, fields)
+
+
+def _project_route(route: dict) -> dict:
+    return {
+        "stationIntervals": [
+            {
+                "id": si.get("id"),
+                "intervals": [
+                    {"stopId": i.get("stopId"), "timeToArrival": i.get("timeToArrival")}
+                    for i in si.get("intervals", [])
+                ],
+            }
+            for si in route.get("stationIntervals", [])
+        ],
+        "schedules": [
+            {
+                "name": schedule.get("name"),
+                "knownJourneys": [
+                    {
+                        "hour": j.get("hour"),
+                        "minute": j.get("minute"),
+                        "intervalId": j.get("intervalId"),
+                    }
+                    for j in schedule.get("knownJourneys", [])
+                ],
+            }
+            for schedule in route.get("schedules", [])
+        ],
+    }
+
+
+def decode_timetable(text: str | bytes) -> dict:
+    """Decode a timetable response, keeping what timetable.compile_timetable reads."""
+    data = loads(text)
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a timetable object, got {type(data).__name__}")
+    timetable = data.get("timetable", {})
+    result = {
+        "timetable": {
+            "departureStopId": timetable.get("departureStopId", ""),
+            "routes": [_project_route(route) for route in timetable.get("routes", [])],
+        }
+    }
+    for key in ("stops", "stations"):
+        if key in data:
+            result[key] = project(data[key], ("id", "towards"))
+    return result
+
+
+async def async_decode(
+    hass, text: str | bytes, decoder: Callable[..., Any], *args
+) -> Any:
+    """Run decoder(text, *args), in an executor when text is large."""
+    if hass is not None and len(text) > EXECUTOR_THRESHOLD:
+        return await hass.async_add_executor_job(decoder, text, *args)
+    return decoder(text, *args)
@@ -0,0 +1,26 @@
+"""Diagnostics support for London TfL."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_NR_API_KEY, CONF_STOPS, CONF_TFL_APP_KEY
+from .ratelimit import quota_usage
+
+TO_REDACT = {CONF_NR_API_KEY, CONF_TFL_APP_KEY}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return the entry's configuration and the current request quota use."""
+    return {
+        "data": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": async_redact_data(dict(entry.options), TO_REDACT),
+        "stops": len(entry.options.get(CONF_STOPS) or entry.data.get(CONF_STOPS, [])),
+        "quota": quota_usage(),
+    }
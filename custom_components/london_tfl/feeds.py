@@ -0,0 +1,213 @@
+"""
+Arrivals feeds shared between stops.
+
+TfL's StopPoint arrivals cover every line calling at a stop, so all the
+bus routes configured at one bus stop, and all the lines configured at one
+tube, DLR or Elizabeth line station (from STATION_FEED_MIN_LINES of them),
+are served by a single request whose predictions are split by line once.
+Once LINE_FEED_MIN_STATIONS stations on one such line are configured, the
+line's arrivals are fetched in one request instead and split by station.
+Coordinators register their stop with the FeedRegistry kept in hass.data;
+TfLData.fetch then takes the stop's slice of its feed instead of making its
+own request.
+"""
+
+from __future__ import annotations
+
+import logging
+import uuid
+from typing import TYPE_CHECKING
+
+from .const import (
+    DATA_FEEDS,
+    TFL_ARRIVALS_URL,
+    TFL_BUS_ARRIVALS_URL,
+    TFL_LINE_ARRIVALS_URL,
+    TFL_STATION_ARRIVALS_URL,
+)
+from .decode import arrival_fields, async_decode, decode_arrivals
+from .network import SingleFlight, get_session, request
+
+if TYPE_CHECKING:
+    from .tfl_data import TfLData
+
+_LOGGER = logging.getLogger(__name__)
+
+# Stops polling within this many seconds of each other share one response.
+FEED_TTL = 20.0
+# Lines at one station fetched with a single station-wide request from this many.
+STATION_FEED_MIN_LINES = 2
+# Stations on one line fetched with a single line-wide request from this many.
+LINE_FEED_MIN_STATIONS = 4
+
+
+def split_arrivals(items: list[dict], field: str) -> dict[str, list[dict]]:
+    """Group predictions by the value of field, in one pass."""
+    slices: dict[str, list[dict]] = {}
+    for item in items:
+        slices.setdefault(item.get(field), []).append(item)
+    return slices
+
+
+class ArrivalsFeed:
+    """One arrivals request whose predictions are split between several stops.
+
+    url is an arrivals URL template from const, formatted with line, station
+    and the cache-buster value like TfLData.url.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        line: str = "",
+        station: str = "",
+        split_field: str,
+        fields: tuple[str, ...],
+        cache_buster: bool = False,
+        app_key: str | None = None,
+    ) -> None:
+        self.url = url
+        self.line = line
+        self.station = station
+        self.split_field = split_field
+        self.fields = tuple(dict.fromkeys((*fields, split_field)))
+        self.cache_buster = cache_buster
+        self.app_key = app_key
+        # Error strings are not reused.
+        self.__shared = SingleFlight(keep=lambda result: isinstance(result, dict))
+
+    async def async_get(self, hass, value: str) -> str | list:
+        """Return the predictions whose split_field is value, or an error string.
+
+        One request serves every caller, and its slices are reused for
+        FEED_TTL seconds. Errors are not cached.
+        """
+        result = await self.__shared.run(None, lambda: self.__fetch(hass), FEED_TTL)
+        if isinstance(result, str):
+            return result
+        return result.get(value, [])
+
+    async def __fetch(self, hass) -> str | dict[str, list[dict]]:
+        test = str(uuid.uuid4()) if self.cache_buster else ""
+        url = self.url.format(self.line, self.station, test)
+        try:
+            result = await request(
+                url,
+                key=self.url.format(self.line, self.station, ""),
+                session=get_session(hass),
+                use_cache=not self.cache_buster,
+                app_key=self.app_key,
+            )
+            if not result:
+                _LOGGER.warning("There was no reply from TfL servers for %s", url)
+                return "Cannot reach TfL"
+            items = await async_decode(hass, result, decode_arrivals, self.fields)
+        except ValueError:
+            _LOGGER.exception("Failed to interpret received JSON for %s", url)
+            return "Cannot interpret JSON from TfL"
+        except OSError:
+            _LOGGER.exception("Internal error during request to %s", url)
+            return "Cannot reach TfL"
+        return split_arrivals(items, self.split_field)
+
+
+class FeedRegistry:
+    """Stops registered by their coordinators, and the feeds serving them.
+
+    Which stops share a feed is worked out again whenever a stop is added or
+    removed; stops left without a feed make their own requests.
+    """
+
+    def __init__(self) -> None:
+        self._stops: dict[TfLData, None] = {}
+        self._feeds: dict[tuple, ArrivalsFeed] = {}
+        # Stop -> (feed key, value of the feed's split_field for that stop).
+        self._assigned: dict[TfLData, tuple[tuple, str]] = {}
+
+    def register(self, tfl_data: TfLData) -> None:
+        self._stops[tfl_data] = None
+        self._plan()
+
+    def unregister(self, tfl_data: TfLData) -> None:
+        if tfl_data in self._stops:
+            del self._stops[tfl_data]
+            self._plan()
+
+    def _plan(self) -> None:
+        stations_on_line: dict[tuple, set[str]] = {}
+        for stop in self._stops:
+            if _uses_line_arrivals(stop):
+                stations_on_line.setdefault(_line_group(stop), set()).add(stop.station)
+
+        def line_fed(stop: TfLData) -> bool:
+            return len(stations_on_line[_line_group(stop)]) >= LINE_FEED_MIN_STATIONS
+
+        # Lines already covered by a line-wide feed do not count towards a station feed.
+        lines_at_station: dict[tuple, set[str]] = {}
+        for stop in self._stops:
+            if _uses_line_arrivals(stop) and not line_fed(stop):
+                lines_at_station.setdefault(_station_group(stop), set()).add(stop.line)
+
+        feeds: dict[tuple, ArrivalsFeed] = {}
+        assigned: dict[TfLData, tuple[tuple, str]] = {}
+        for stop in self._stops:
+            if stop.method == "bus":
+                key = ("stop", *_station_group(stop))
+                url, split_field, value = TFL_BUS_ARRIVALS_URL, "lineId", stop.line
+            elif not _uses_line_arrivals(stop):
+                continue
+            elif line_fed(stop):
+                key = ("line", *_line_group(stop))
+                url, split_field, value = (
+                    TFL_LINE_ARRIVALS_URL,
+                    "naptanId",
+                    stop.station,
+                )
+            elif len(lines_at_station[_station_group(stop)]) >= STATION_FEED_MIN_LINES:
+                key = ("station", *_station_group(stop))
+                url, split_field, value = TFL_STATION_ARRIVALS_URL, "lineId", stop.line
+            else:
+                continue
+            feed = feeds.get(key) or self._feeds.get(key)
+            if feed is None:
+                feed = ArrivalsFeed(
+                    url,
+                    line=stop.line,
+                    station=stop.station,
+                    split_field=split_field,
+                    fields=arrival_fields(stop.transport_type()),
+                    cache_buster=stop.cache_buster,
+                    app_key=stop.app_key,
+                )
+            feeds[key] = feed
+            assigned[stop] = (key, value)
+        self._feeds = feeds
+        self._assigned = assigned
+
+    async def async_fetch(self, hass, tfl_data: TfLData) -> str | list | None:
+        """Return the stop's predictions from its feed; None if it has no feed."""
+        entry = self._assigned.get(tfl_data)
+        if entry is None:
+            return None
+        key, value = entry
+        return await self._feeds[key].async_get(hass, value)
+
+
+def _uses_line_arrivals(stop: TfLData) -> bool:
+    """Whether the stop normally requests /line/{line}/arrivals/{station}."""
+    return stop.transport_type()["url"] == TFL_ARRIVALS_URL
+
+
+def _station_group(stop: TfLData) -> tuple:
+    # Stops only share a request if they would have made it the same way.
+    return (stop.station, stop.app_key, stop.cache_buster)
+
+
+def _line_group(stop: TfLData) -> tuple:
+    return (stop.line, stop.app_key, stop.cache_buster)
+
+
+def get_feeds(hass) -> FeedRegistry:
+    """Return the registry of shared feeds, creating it on first use."""
+    return hass.data.setdefault(DATA_FEEDS, FeedRegistry())
@@ -0,0 +1,119 @@
+"""
+Minimal SOAP client pieces for the LDBWS GetDepartureBoard call.
+
+zeep builds an object graph for every service on a board although we only
+read a handful of fields. The envelope here is a fixed template and the
+response is parsed incrementally, emitting LDBWSDeparture-ready dicts with
+just those fields. network.LDBWS falls back to zeep if this path fails.
+"""
+
+from __future__ import annotations
+
+from xml.etree.ElementTree import XMLPullParser
+from xml.sax.saxutils import escape
+
+LDBWS_ENDPOINT = "https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb12.asmx"
+GET_DEPARTURE_BOARD_ACTION = "http://thalesgroup.com/RTTI/2012-01-13/ldb/GetDepartureBoard"
+
+_ENVELOPE = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:typ="http://thalesgroup.com/RTTI/2013-11-28/Token/types"'
+    ' xmlns:ldb="http://thalesgroup.com/RTTI/2021-11-01/ldb/">'
+    "<soap:Header><typ:AccessToken><typ:TokenValue>{token}</typ:TokenValue>"
+    "</typ:AccessToken></soap:Header>"
+    "<soap:Body><ldb:GetDepartureBoardRequest>"
+    "<ldb:numRows>{rows}</ldb:numRows><ldb:crs>{crs}</ldb:crs>"
+    "</ldb:GetDepartureBoardRequest></soap:Body>"
+    "</soap:Envelope>"
+)
+
+# Fields read from each trainServices/service element.
+SERVICE_FIELDS = ("std", "platform", "operator", "operatorCode")
+
+
+class SoapFault(Exception):
+    """The response was a SOAP fault."""
+
+
+class UnexpectedResponse(Exception):
+    """The response was not a departure board we understand."""
+
+
+def departure_board_envelope(token: str, crs: str, rows: int) -> bytes:
+    """Return the GetDepartureBoard request body."""
+    return _ENVELOPE.format(
+        token=escape(token), crs=escape(crs), rows=int(rows)
+    ).encode()
+
+
+def _local(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+class DepartureBoardParser:
+    """Incremental GetDepartureBoard response parser.
+
+    feed() the response body in chunks, then close() returns the station
+    name and one dict per service with a destination.
+    """
+
+    def __init__(self) -> None:
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._path: list[str] = []
+        self._service: dict | None = None
+        self._services: list[dict] = []
+        self._location_name: str | None = None
+        self._fault: str | None = None
+        self._seen_result = False
+
+    def feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        self._handle_events()
+
+    def close(self) -> tuple[str, list[dict]]:
+        """Finish parsing; raise SoapFault or UnexpectedResponse without a board."""
+        self._parser.close()
+        self._handle_events()
+        if self._fault is not None:
+            raise SoapFault(self._fault)
+        if not self._seen_result:
+            raise UnexpectedResponse("no GetStationBoardResult in response")
+        return self._location_name or "", self._services
+
+    def _handle_events(self) -> None:
+        for event, elem in self._parser.read_events():
+            name = _local(elem.tag)
+            if event == "start":
+                if name == "service" and self._parent() == "trainServices":
+                    self._service = {}
+                elif name == "GetStationBoardResult":
+                    self._seen_result = True
+                self._path.append(name)
+                continue
+
+            self._path.pop()
+            parent = self._parent()
+            if self._service is not None:
+                if name == "service" and parent == "trainServices":
+                    if "destination" in self._service:
+                        self._services.append(self._service)
+                    self._service = None
+                elif parent == "service" and name in SERVICE_FIELDS:
+                    self._service[name] = elem.text
+                elif (
+                    name == "locationName"
+                    and self._path[-3:] == ["service", "destination", "location"]
+                ):
+                    # Only the first destination is shown.
+                    self._service.setdefault("destination", elem.text or "")
+            elif name == "locationName" and parent == "GetStationBoardResult":
+                self._location_name = elem.text
+            elif name == "faultstring":
+                self._fault = elem.text or "SOAP fault"
+            if parent in ("trainServices", "service", "destination", "location"):
+                # Release parsed subtrees as we go.
+                elem.clear()
+
+    def _parent(self) -> str | None:
+        return self._path[-1] if self._path else None
@@ -1,38 +1,324 @@
 import asyncio
 import datetime
 import logging
-from typing import List
+import os
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+from xml.etree.ElementTree import ParseError
 from zoneinfo import ZoneInfo
 
 import aiohttp
-import async_timeout
-import httpx
 from attr import dataclass
-from zeep import AsyncClient, xsd
-from zeep.exceptions import Fault
-from zeep.transports import AsyncTransport
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import ssl as ssl_util
+
+from .const import DATA_SESSION
+from .ldbws_soap import (
+    GET_DEPARTURE_BOARD_ACTION,
+    LDBWS_ENDPOINT,
+    DepartureBoardParser,
+    SoapFault,
+    UnexpectedResponse,
+    departure_board_envelope,
+)
+from .ratelimit import (
+    PRIORITY_REALTIME,
+    RateLimiter,
+    ldbws_limiter,
+    parse_retry_after,
+    tfl_limiter,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Connection pool settings for the integration-wide aiohttp session.
+POOL_LIMIT_PER_HOST = 8
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+# Identical logical requests completing within this many seconds share a response.
+COALESCE_TTL = 5.0
+
+# Upper bounds on the number of responses kept by the HTTP response cache and
+# on the total length of their bodies.
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 1024 * 1024
+# Larger bodies (timetables, stop lists) are decoded and projected as soon as
+# they arrive, so keeping them for revalidation would hold them all in memory.
+CACHE_MAX_BODY = 64 * 1024
+
+
+class SingleFlight:
+    """Shares one run of a coroutine between the callers of the same key.
+
+    Callers arriving while a run is in flight await it instead of starting
+    another, and its result is reused for the ttl given to run. Results that
+    keep rejects, exceptions and cancellations are not reused.
+    """
+
+    def __init__(self, keep: Callable[[Any], bool] = lambda result: True) -> None:
+        self._keep = keep
+        self._tasks: dict[Hashable, asyncio.Future] = {}
+        self._recent: dict[Hashable, tuple[float, Any]] = {}
+
+    async def run(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]], ttl: float
+    ) -> Any:
+        """Return factory()'s result for key, sharing it as described above."""
+        recent = self._recent.get(key)
+        if recent is not None and time.monotonic() - recent[0] < ttl:
+            return recent[1]
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t, ttl))
+        # Shield so that one caller being cancelled does not cancel the others.
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future, ttl: float) -> None:
+        self._tasks.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if not self._keep(task.result()):
+            return
+        now = time.monotonic()
+        # Drop expired results so keys that are no longer used do not pile up.
+        for stale in [k for k, (ts, _) in self._recent.items() if now - ts >= ttl]:
+            del self._recent[stale]
+        self._recent[key] = (now, task.result())
+
+    def forget(self, key: Hashable) -> None:
+        """Stop reusing the last result for key."""
+        self._recent.pop(key, None)
+
+    def clear(self) -> None:
+        self._tasks.clear()
+        self._recent.clear()
+
+
+# Failed requests return None and are not reused.
+_requests = SingleFlight(keep=lambda body: body is not None)
 
-async def fetch(session, url):
+
+@dataclass(slots=True)
+class CachedResponse:
+    body: str
+    expires: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+
+_response_cache: OrderedDict[str, CachedResponse] = OrderedDict()
+
+
+def freshness_lifetime(headers) -> float | None:
+    """Return how many seconds a response stays fresh, or None if it must not be stored.
+
+    Follows Cache-Control (no-store, no-cache, max-age) and subtracts the Age
+    added by intermediate caches.
+    """
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
     try:
-        with async_timeout.timeout(15):
-            async with session.get(
-                url, headers={"Accept": "application/json"}
-            ) as response:
-                return await response.text()
-    except asyncio.TimeoutError:
-        _LOGGER.warning("Request to %s timed out", url)
-    except aiohttp.ClientError as e:
-        _LOGGER.warning("Request to %s failed: %s", url, e)
-    except OSError as e:
-        _LOGGER.warning("Request to %s failed: %s", url, e)
-
-
-async def request(url):
+        max_age = float(directives["max-age"])
+    except (KeyError, ValueError):
+        return 0.0
+    try:
+        age = float(headers.get("Age", 0))
+    except ValueError:
+        age = 0.0
+    return max(max_age - age, 0.0)
+
+
+def _remember_response(cache_key: str, headers, body: str) -> None:
+    lifetime = freshness_lifetime(headers)
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if (
+        lifetime is None
+        or (lifetime == 0 and not etag and not last_modified)
+        or len(body) > CACHE_MAX_BODY
+    ):
+        _response_cache.pop(cache_key, None)
+        return
+    _response_cache[cache_key] = CachedResponse(
+        body=body,
+        expires=time.monotonic() + lifetime,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    _response_cache.move_to_end(cache_key)
+    size = sum(len(cached.body) for cached in _response_cache.values())
+    while len(_response_cache) > CACHE_MAX_ENTRIES or size > CACHE_MAX_BYTES:
+        _, evicted = _response_cache.popitem(last=False)
+        size -= len(evicted.body)
+
+
+async def fetch(
+    session,
+    url,
+    cache_key=None,
+    limiter: RateLimiter | None = None,
+    priority: int = PRIORITY_REALTIME,
+):
+    """GET url and return the response body, or None on failure.
+
+    With a cache_key, fresh cached responses are served without a request and
+    stale ones are revalidated with If-None-Match/If-Modified-Since. Requests
+    that do go out first take a token from limiter at the given priority.
+    """
+    cached = _response_cache.get(cache_key) if cache_key else None
+    if cached is not None and cached.is_fresh():
+        return cached.body
+
+    if limiter is not None:
+        await limiter.acquire(priority)
+
+    headers = {"Accept": "application/json"}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    try:
+        async with asyncio.timeout(15):
+            async with session.get(url, headers=headers) as response:
+                if response.status == 429:
+                    if limiter is not None:
+                        limiter.backoff(parse_retry_after(response.headers.get("Retry-After")))
+                    return None
+                if response.status == 304 and cached is not None:
+                    lifetime = freshness_lifetime(response.headers)
+                    cached.expires = time.monotonic() + (lifetime or 0.0)
+                    return cached.body
+                body = await response.text()
+                if cache_key and response.status == 200:
+                    _remember_response(cache_key, response.headers, body)
+                return body
+    except TimeoutError:
+        _LOGGER.warning("Request to %s timed out", redact_app_key(url))
+    except (aiohttp.ClientError, OSError) as e:
+        _LOGGER.warning(
+            "Request to %s failed: %s", redact_app_key(url), redact_app_key(str(e))
+        )
+
+
+def get_session(hass) -> aiohttp.ClientSession:
+    """Return the integration's pooled session, creating it on first use.
+
+    The session keeps connections to api.tfl.gov.uk alive between polls and
+    is closed when the last config entry unloads or Home Assistant stops.
+    """
+    session = hass.data.get(DATA_SESSION)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_util.get_default_context(),
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        hass.data[DATA_SESSION] = session
+
+        async def _close(_event) -> None:
+            await session.close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _close)
+    return session
+
+
+async def async_close_session(hass) -> None:
+    """Close the pooled session, releasing all of its connections."""
+    session = hass.data.pop(DATA_SESSION, None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def with_app_key(url: str, app_key: str | None) -> str:
+    """Append the TfL app_key query parameter to url, if one is configured."""
+    if not app_key:
+        return url
+    return url + ("&" if "?" in url else "?") + "app_key=" + app_key
+
+
+_APP_KEY_PARAM = re.compile(r"(app_key=)[^&#\s]+")
+
+
+def redact_app_key(text: str) -> str:
+    """Hide the value of any app_key query parameter in text, for logging."""
+    return _APP_KEY_PARAM.sub(r"\1<redacted>", text)
+
+
+async def _request(
+    url, session=None, cache_key=None, limiter=None, priority=PRIORITY_REALTIME
+):
+    if session is not None:
+        return await fetch(session, url, cache_key, limiter, priority)
     async with aiohttp.ClientSession() as session:
-        return await fetch(session, url)
+        return await fetch(session, url, cache_key, limiter, priority)
+
+
+async def request(
+    url,
+    *,
+    key=None,
+    session=None,
+    use_cache=True,
+    priority: int = PRIORITY_REALTIME,
+    app_key: str | None = None,
+):
+    """Fetch url, sharing one response between callers of the same logical request.
+
+    key identifies the logical request and defaults to url; pass it when url
+    carries a cache-buster so that otherwise identical requests still coalesce.
+    Concurrent callers await a single HTTP request, and a successful response
+    is reused for COALESCE_TTL seconds. Pass the pooled session from
+    get_session; without one a throwaway session is used. Unless use_cache
+    is False, responses also go through the HTTP response cache under key.
+    Requests are rate limited per app_key (see ratelimit), queued by priority.
+    """
+    key = key or url
+    return await _requests.run(
+        key,
+        lambda: _request(
+            with_app_key(url, app_key),
+            session,
+            key if use_cache else None,
+            tfl_limiter(app_key),
+            priority,
+        ),
+        COALESCE_TTL,
+    )
+
+
+LDBWS_WSDL_URL = "https://lite.realtime.nationalrail.co.uk/OpenLDBWS/wsdl.aspx?ver=2021-11-01"
+# The WSDL and its schemas are kept on disk until explicitly refreshed.
+LDBWS_WSDL_CACHE = "london_tfl.ldbws_wsdl.sqlite"
+
+# Departure board rows requested per stop, and the most LDBWS returns at once.
+DEFAULT_BOARD_ROWS = 10
+MAX_BOARD_ROWS = 150
+# Stops at the same station polling within this many seconds share one board.
+BOARD_TTL = 20.0
+# After zeep had to read a board the fast path did not understand, zeep is
+# used for this many seconds before the fast path is tried again.
+FAST_PATH_RETRY = 3600.0
 
 
 @dataclass
@@ -56,7 +342,7 @@ class LDBWSDeparture:
             now_london += datetime.timedelta(days=1)
         departure_dt = now_london.replace(
             hour=hour_int, minute=int(minutes), second=0, microsecond=0
-        ).astimezone(datetime.timezone.utc).isoformat()
+        ).astimezone(datetime.UTC).isoformat()
 
         return {
             # Arrival is always None so we just use the departure instead
@@ -72,15 +358,25 @@ class LDBWSError(Exception):
     """Raised when an error occurs while interacting with the LDBWS API."""
 
 
-class LDBWS:
-    def __init__(self, *, token: str):
-        # FIXME: we should use the default transport but zeep crashes due to changes in httpx
+class _ZeepLDBWS:
+    """GetDepartureBoard through zeep, used when the SOAP fast path fails."""
+
+    def __init__(self, *, token: str, cache=None):
+        # Imported here so that zeep stays off the hot path until needed.
+        import httpx
+        from zeep import AsyncClient, xsd
+        from zeep.transports import AsyncTransport
+
+        # FIXME: we should use the default transport but zeep crashes due to changes
+        # in httpx
         # see https://github.com/mvantellingen/python-zeep/pull/1462
-        httpx_client = httpx.AsyncClient(verify=True)
-        wsdl_client = httpx.Client(verify=True, timeout=300)
+        self.__httpx_client = httpx.AsyncClient(verify=True)
+        self.__wsdl_client = httpx.Client(verify=True, timeout=300)
         self.__client = AsyncClient(
-            wsdl="https://lite.realtime.nationalrail.co.uk/OpenLDBWS/wsdl.aspx?ver=2021-11-01",
-            transport=AsyncTransport(client=httpx_client, wsdl_client=wsdl_client),
+            wsdl=LDBWS_WSDL_URL,
+            transport=AsyncTransport(
+                client=self.__httpx_client, wsdl_client=self.__wsdl_client, cache=cache
+            ),
         )
 
         token_header = xsd.Element(
@@ -96,10 +392,17 @@ class LDBWS:
         )
         self.__headers = [token_header(TokenValue=token)]
 
-    async def get_departures(self, crs: str, *, n: int = 10) -> List[LDBWSDeparture]:
+    async def async_close(self) -> None:
+        """Close the HTTP clients used by the SOAP client."""
+        await self.__httpx_client.aclose()
+        self.__wsdl_client.close()
+
+    async def get_departures(self, crs: str, *, n: int) -> list[LDBWSDeparture]:
         """
         Raises LDBWSError if the request fails.
         """
+        from zeep.exceptions import Fault
+
         try:
             res = await self.__client.service.GetDepartureBoard(
                 numRows=n, crs=crs, _soapheaders=self.__headers
@@ -123,7 +426,231 @@ class LDBWS:
                     operator_code=(service.operatorCode or "").upper(),
                     operator_id=service.operator.lower().replace(" ", "-"),
                     scheduled_departure_time=service.std,
-                    # Note: etd is either `On time` or contains the estimated departure time
+                    # Note: etd is either `On time` or contains the estimated
+                    # departure time
                 )
             )
         return result
+
+
+class LDBWS:
+    """LDBWS departure boards for one token.
+
+    Requests go through the pooled aiohttp session with a fixed SOAP envelope
+    (see ldbws_soap). The zeep client is only built, from the cached WSDL, if
+    a response is well-formed XML but not a board the fast path understands,
+    e.g. after a schema change; zeep is then used for FAST_PATH_RETRY seconds.
+    Transport errors, HTTP errors and SOAP faults are raised as LDBWSError.
+    """
+
+    def __init__(
+        self, hass, *, token: str, session: aiohttp.ClientSession | None = None
+    ):
+        self.__hass = hass
+        self.__token = token
+        self.__session = session
+        self.__limiter = ldbws_limiter(token)
+        self.__zeep: _ZeepLDBWS | None = None
+        # Monotonic time before which zeep is used instead of the fast path.
+        self.__fast_path_retry_at = 0.0
+        # Per CRS: rows wanted by subscribed stops, and the shared boards.
+        self.__board_rows: dict[str, int] = {}
+        self.__boards = SingleFlight()
+
+    async def async_close(self) -> None:
+        """Close the zeep client, if one was built."""
+        if self.__zeep is not None:
+            await self.__zeep.async_close()
+            self.__zeep = None
+
+    def subscribe(self, crs: str, rows: int = DEFAULT_BOARD_ROWS) -> None:
+        """Add rows to the shared board fetched for crs."""
+        self.__board_rows[crs] = self.__board_rows.get(crs, 0) + rows
+
+    def unsubscribe(self, crs: str, rows: int = DEFAULT_BOARD_ROWS) -> None:
+        remaining = self.__board_rows.get(crs, 0) - rows
+        if remaining > 0:
+            self.__board_rows[crs] = remaining
+        else:
+            self.__board_rows.pop(crs, None)
+            self.__boards.forget(crs)
+
+    async def get_board(self, crs: str) -> list[LDBWSDeparture]:
+        """Return the departure board for crs, shared by every stop at the station.
+
+        One request covers all subscribed stops: numRows is the sum of their
+        rows, and the board is reused for BOARD_TTL seconds. Callers filter it
+        by operator themselves. Raises LDBWSError if the request fails.
+        """
+        rows = min(MAX_BOARD_ROWS, self.__board_rows.get(crs) or DEFAULT_BOARD_ROWS)
+        return await self.__boards.run(
+            crs, lambda: self.get_departures(crs, n=rows), BOARD_TTL
+        )
+
+    async def get_departures(
+        self, crs: str, *, n: int = DEFAULT_BOARD_ROWS
+    ) -> list[LDBWSDeparture]:
+        """
+        Raises LDBWSError if the request fails.
+        """
+        await self.__limiter.acquire()
+        session = self.__current_session()
+        if session is None or time.monotonic() < self.__fast_path_retry_at:
+            return await self.__zeep_departures(crs, n)
+
+        try:
+            return await self.__fast_departures(crs, n)
+        except UnexpectedResponse as e:
+            _LOGGER.info("LDBWS board for %s not understood (%s), using zeep", crs, e)
+        self.__fast_path_retry_at = time.monotonic() + FAST_PATH_RETRY
+        return await self.__zeep_departures(crs, n)
+
+    def __current_session(self) -> aiohttp.ClientSession | None:
+        # The pooled session is closed when the last config entry unloads; a
+        # client still in use afterwards moves to the session replacing it.
+        if self.__session is not None and self.__session.closed:
+            self.__session = get_session(self.__hass)
+        return self.__session
+
+    async def __fast_departures(self, crs: str, n: int) -> list[LDBWSDeparture]:
+        """
+        Raises UnexpectedResponse for a well-formed board zeep may still read,
+        LDBWSError for anything else.
+        """
+        parser = DepartureBoardParser()
+        status = None
+        try:
+            async with asyncio.timeout(15):
+                async with self.__session.post(
+                    LDBWS_ENDPOINT,
+                    data=departure_board_envelope(self.__token, crs, n),
+                    headers={
+                        "Content-Type": "text/xml; charset=utf-8",
+                        "SOAPAction": GET_DEPARTURE_BOARD_ACTION,
+                    },
+                ) as response:
+                    status = response.status
+                    # SOAP faults come back as 500, other errors are not worth parsing.
+                    if status not in (200, 500):
+                        raise LDBWSError(f"LDBWS returned HTTP {status}")
+                    async for chunk in response.content.iter_chunked(8192):
+                        parser.feed(chunk)
+            location_name, services = parser.close()
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise LDBWSError("could not reach LDBWS") from e
+        except SoapFault as e:
+            raise LDBWSError(f"LDBWS fault: {e}") from e
+        except (UnexpectedResponse, ParseError) as e:
+            if status == 200 and isinstance(e, UnexpectedResponse):
+                raise
+            raise LDBWSError(
+                f"LDBWS returned an unreadable response (HTTP {status})"
+            ) from e
+        return [
+            LDBWSDeparture(
+                location_name=location_name,
+                platform=service.get("platform") or "?",
+                destination_name=service["destination"],
+                operator_code=(service.get("operatorCode") or "").upper(),
+                operator_id=(service.get("operator") or "").lower().replace(" ", "-"),
+                scheduled_departure_time=service.get("std") or "",
+            )
+            for service in services
+        ]
+
+    async def __zeep_departures(self, crs: str, n: int) -> list[LDBWSDeparture]:
+        if self.__zeep is None:
+            self.__zeep = await self.__hass.async_add_executor_job(
+                _build_zeep_ldbws, self.__hass, self.__token
+            )
+        return await self.__zeep.get_departures(crs, n=n)
+
+
+class _RecordingCache:
+    """zeep cache that always misses, remembering every document downloaded."""
+
+    def __init__(self) -> None:
+        self.documents: dict[str, bytes] = {}
+
+    def add(self, url, content):
+        self.documents[url] = content
+
+    def get(self, url):
+        return None
+
+
+def _wsdl_cache(hass):
+    from zeep.cache import SqliteCache
+
+    os.makedirs(hass.config.path(STORAGE_DIR), exist_ok=True)
+    return SqliteCache(
+        path=hass.config.path(STORAGE_DIR, LDBWS_WSDL_CACHE), timeout=None
+    )
+
+
+def _build_zeep_ldbws(hass, token: str) -> _ZeepLDBWS:
+    # Only the first client ever built downloads the WSDL, see async_refresh_ldbws_wsdl.
+    return _ZeepLDBWS(token=token, cache=_wsdl_cache(hass))
+
+
+def _download_wsdl(hass) -> _ZeepLDBWS:
+    recorder = _RecordingCache()
+    # Building the client fails on a bad download, leaving the cache untouched.
+    client = _ZeepLDBWS(token="", cache=recorder)
+    cache = _wsdl_cache(hass)
+    for url, content in recorder.documents.items():
+        cache.add(url, content)
+    return client
+
+
+async def async_refresh_ldbws_wsdl(hass) -> None:
+    """Download the LDBWS WSDL and schemas again, replacing the cached copies.
+
+    Clients already built keep the definition they were built with until
+    their config entry is reloaded.
+    """
+    client = await hass.async_add_executor_job(_download_wsdl, hass)
+    await client.async_close()
+
+
+@dataclass(slots=True)
+class _PooledLDBWS:
+    client: LDBWS
+    users: int = 0
+
+
+# One LDBWS client per token, shared by every National Rail stop in the process.
+_ldbws_pool: dict[str, _PooledLDBWS] = {}
+# Kept for as long as the process runs, so every caller for a token waits on the
+# same lock even while its client is being closed.
+_ldbws_locks: dict[str, asyncio.Lock] = {}
+
+
+async def async_acquire_ldbws(hass, token: str) -> LDBWS:
+    """Return the shared LDBWS client for token, creating it on first use.
+
+    Concurrent first callers get the same client. Every call must be paired
+    with async_release_ldbws.
+    """
+    lock = _ldbws_locks.setdefault(token, asyncio.Lock())
+    async with lock:
+        pooled = _ldbws_pool.get(token)
+        if pooled is None:
+            client = LDBWS(hass, token=token, session=get_session(hass))
+            pooled = _ldbws_pool[token] = _PooledLDBWS(client)
+        pooled.users += 1
+        return pooled.client
+
+
+async def async_release_ldbws(token: str) -> None:
+    """Drop one reference to the client for token, closing it with the last one."""
+    lock = _ldbws_locks.setdefault(token, asyncio.Lock())
+    async with lock:
+        pooled = _ldbws_pool.get(token)
+        if pooled is None:
+            return
+        pooled.users -= 1
+        if pooled.users > 0:
+            return
+        del _ldbws_pool[token]
+    await pooled.client.async_close()
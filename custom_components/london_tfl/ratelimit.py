@@ -0,0 +1,163 @@
+"""
+Integration-wide request rate limiting.
+
+Every outgoing TfL or LDBWS request takes a token from a per-API (and per
+key) token bucket. When the bucket is empty, callers queue by priority, so
+realtime arrivals go out before timetables, and timetables before line and
+stop catalogues. A 429 response pauses the bucket for its Retry-After.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_REALTIME = 0
+PRIORITY_TIMETABLE = 1
+PRIORITY_CATALOGUE = 2
+
+# Requests per minute. TfL allows far more with an app_key than anonymously.
+TFL_ANONYMOUS_RATE = 50
+TFL_APP_KEY_RATE = 500
+LDBWS_RATE = 100
+# Retry-After to assume when a 429 response does not carry one.
+DEFAULT_RETRY_AFTER = 60.0
+
+_limiters: dict[str, RateLimiter] = {}
+
+
+class RateLimiter:
+    """Token bucket with priority queueing and 429 back-off."""
+
+    def __init__(
+        self, name: str, rate_per_minute: float, burst: int | None = None
+    ) -> None:
+        self.name = name
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst if burst is not None else max(1, int(rate_per_minute // 6))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._drainer: asyncio.Task | None = None
+        self._sent: deque[float] = deque()
+        self._throttled = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate_per_minute / 60
+        )
+        self._updated = now
+
+    def _take(self) -> None:
+        self._tokens -= 1
+        now = time.monotonic()
+        self._sent.append(now)
+        while self._sent and now - self._sent[0] > 60:
+            self._sent.popleft()
+
+    def _delay(self) -> float:
+        """Seconds until a token can be handed out."""
+        now = time.monotonic()
+        delay = max(0.0, self._blocked_until - now)
+        if self._tokens < 1:
+            delay = max(delay, (1 - self._tokens) * 60 / self.rate_per_minute)
+        return delay
+
+    async def acquire(self, priority: int = PRIORITY_REALTIME) -> None:
+        """Wait until a request may be sent."""
+        self._refill()
+        if not self._waiters and self._delay() == 0:
+            self._take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if all(waiter.done() for *_, waiter in self._waiters):
+                # Nobody is left waiting, so stop sleeping on their behalf.
+                self._waiters.clear()
+                self._drainer.cancel()
+            raise
+
+    async def _drain(self) -> None:
+        while self._waiters:
+            self._refill()
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # The caller was cancelled while queued.
+                continue
+            self._take()
+            future.set_result(None)
+
+    def backoff(self, retry_after: float | None) -> None:
+        """Pause all requests after the API answered 429 Too Many Requests."""
+        seconds = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        self._throttled += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        _LOGGER.warning(
+            "%s rate limit hit, pausing requests for %.0fs", self.name, seconds
+        )
+
+    def usage(self) -> dict:
+        """Return the current quota use, e.g. for diagnostics."""
+        self._refill()
+        now = time.monotonic()
+        return {
+            "rate_per_minute": self.rate_per_minute,
+            "requests_last_minute": sum(1 for sent in self._sent if now - sent <= 60),
+            "tokens_available": round(self._tokens, 2),
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "throttled_responses": self._throttled,
+            "blocked_for": round(max(0.0, self._blocked_until - now), 1),
+        }
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the Retry-After delay in seconds; HTTP dates are not used by TfL."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _get(key: str, name: str, rate_per_minute: float) -> RateLimiter:
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = RateLimiter(name, rate_per_minute)
+    return limiter
+
+
+def tfl_limiter(app_key: str | None = None) -> RateLimiter:
+    """Return the bucket for TfL requests made with app_key (or anonymously)."""
+    if not app_key:
+        return _get("tfl", "tfl", TFL_ANONYMOUS_RATE)
+    return _get(f"tfl:{app_key}", f"tfl (app key ...{app_key[-4:]})", TFL_APP_KEY_RATE)
+
+
+def ldbws_limiter(token: str) -> RateLimiter:
+    """Return the bucket for LDBWS requests made with token."""
+    return _get(f"ldbws:{token}", f"ldbws (token ...{token[-4:]})", LDBWS_RATE)
+
+
+def quota_usage() -> dict[str, dict]:
+    """Return the current usage of every bucket, keyed by a redacted name."""
+    return {limiter.name: limiter.usage() for limiter in _limiters.values()}
@@ -3,41 +3,48 @@
 from __future__ import annotations
 
 import logging
-import voluptuous as vol
+
 import homeassistant.helpers.config_validation as cv
-from datetime import timedelta
-from typing import Optional
+import voluptuous as vol
 from homeassistant import config_entries, core
-from homeassistant.components.sensor import SensorEntity, PLATFORM_SCHEMA
+from homeassistant.components.sensor import PLATFORM_SCHEMA, SensorEntity
 from homeassistant.const import CONF_NAME
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers import entity_registry as er
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import entity_platform
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import (
-    CONF_STOPS,
+    ATTRIBUTE_FORMATS,
+    CONF_ATTRIBUTE_FORMATS,
+    CONF_CACHE_BUSTER,
     CONF_LINE,
-    CONF_STATION,
-    CONF_PLATFORM,
     CONF_MAX,
+    CONF_METHOD,
     CONF_NR_API_KEY,
+    CONF_PLATFORM,
+    CONF_SHORTEN_STATION_NAMES,
+    CONF_STATION,
+    CONF_STOPS,
+    CONF_TFL_APP_KEY,
+    DEFAULT_ATTRIBUTE_FORMATS,
     DEFAULT_ICONS,
     DEFAULT_MAX,
     DEFAULT_NAME,
     DOMAIN,
-    CONF_SHORTEN_STATION_NAMES,
     get_line_image,
     shortenName,
-    CONF_METHOD,
 )
-from .tfl_data import TfLData
+from .coordinator import LondonTfLCoordinator, stop_key
 from .hasl_utils import as_hasl_departures
-
+from .tfl_data import TfLData, departures_fingerprint
 
 _LOGGER = logging.getLogger(__name__)
-SCAN_INTERVAL = timedelta(minutes=1)
+
+# Upper bound on the departures listed in each card format's attribute.
+MAX_ATTRIBUTE_DEPARTURES = 20
 
 
 CONFIG_STOP = vol.Schema(
@@ -48,17 +55,77 @@ CONFIG_STOP = vol.Schema(
         vol.Optional(CONF_PLATFORM, default=""): cv.string,
         vol.Optional(CONF_MAX, default=DEFAULT_MAX): cv.positive_int,
         vol.Optional(CONF_SHORTEN_STATION_NAMES, default=False): cv.boolean,
+        vol.Optional(CONF_CACHE_BUSTER, default=False): cv.boolean,
+        vol.Optional(
+            CONF_ATTRIBUTE_FORMATS, default=DEFAULT_ATTRIBUTE_FORMATS
+        ): vol.All(cv.ensure_list, [vol.In(ATTRIBUTE_FORMATS)]),
     }
 )
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
+        vol.Optional(CONF_TFL_APP_KEY): cv.string,
         vol.Required(CONF_STOPS): vol.All(cv.ensure_list, [CONFIG_STOP]),
     }
 )
 
 
+def _create_sensors(
+    hass: HomeAssistant,
+    name: str,
+    stops: list,
+    app_key: str | None = None,
+    config_entry: config_entries.ConfigEntry | None = None,
+) -> tuple[list[LondonTfLSensor], list[LondonTfLCoordinator]]:
+    """Create one coordinator per stop and the sensors that share it."""
+    coordinators: dict[tuple, LondonTfLCoordinator] = {}
+    sensors = []
+    for stop in stops:
+        if stop[CONF_STATION] is None or stop[CONF_LINE] is None:
+            continue
+        method = stop[CONF_METHOD] if CONF_METHOD in stop else ""
+        platform_filter = stop[CONF_PLATFORM] if CONF_PLATFORM in stop else ""
+        max_items = stop[CONF_MAX] if CONF_MAX in stop else DEFAULT_MAX
+        key = stop_key(
+            method, stop[CONF_LINE], stop[CONF_STATION], platform_filter, max_items
+        )
+        if key in coordinators:
+            continue
+        coordinator = LondonTfLCoordinator(
+            hass,
+            TfLData(
+                method=method,
+                line=stop[CONF_LINE],
+                station=stop[CONF_STATION],
+                nr_api_key=stop.get(CONF_NR_API_KEY),
+                cache_buster=stop.get(CONF_CACHE_BUSTER, False),
+                app_key=app_key,
+            ),
+            platform_filter=platform_filter,
+            max_items=max_items,
+            config_entry=config_entry,
+        )
+        coordinators[key] = coordinator
+        shorten = (
+            stop[CONF_SHORTEN_STATION_NAMES]
+            if CONF_SHORTEN_STATION_NAMES in stop
+            else False
+        )
+        formats = stop.get(CONF_ATTRIBUTE_FORMATS, DEFAULT_ATTRIBUTE_FORMATS)
+        for mode in coordinator.departure_modes:
+            sensors.append(
+                LondonTfLSensor(
+                    coordinator,
+                    name,
+                    shorten,
+                    departure_mode=mode,
+                    attribute_formats=formats,
+                )
+            )
+    return sensors, list(coordinators.values())
+
+
 async def async_setup_entry(
     hass: core.HomeAssistant,
     config_entry: config_entries.ConfigEntry,
@@ -70,36 +137,13 @@ async def async_setup_entry(
     name = config[CONF_NAME] if CONF_NAME in config else DEFAULT_NAME
     stops = config[CONF_STOPS]
 
-    sensors = []
-    for stop in stops:
-        if stop[CONF_STATION] is not None and stop[CONF_LINE] is not None:
-            shared_data = TfLData(
-                method=stop[CONF_METHOD] if CONF_METHOD in stop else "",
-                line=stop[CONF_LINE],
-                station=stop[CONF_STATION],
-                nr_api_key=stop.get(CONF_NR_API_KEY),
-            )
-            common_kwargs = dict(
-                name=name,
-                method=stop[CONF_METHOD] if CONF_METHOD in stop else "",
-                line=stop[CONF_LINE],
-                station=stop[CONF_STATION],
-                platform_filter=(
-                    stop[CONF_PLATFORM] if CONF_PLATFORM in stop else ""
-                ),
-                max=stop[CONF_MAX] if CONF_MAX in stop else DEFAULT_MAX,
-                shortenStationNames=(
-                    stop[CONF_SHORTEN_STATION_NAMES]
-                    if CONF_SHORTEN_STATION_NAMES in stop
-                    else False
-                ),
-                nr_api_key=stop.get(CONF_NR_API_KEY),
-                tfl_data=shared_data,
-            )
-            sensors.append(LondonTfLSensor(departure_mode="realtime", **common_kwargs))
-            if stop.get(CONF_METHOD) != "national-rail":
-                sensors.append(LondonTfLSensor(departure_mode="scheduled", **common_kwargs))
-                sensors.append(LondonTfLSensor(departure_mode="all", **common_kwargs))
+    sensors, coordinators = _create_sensors(
+        hass,
+        name,
+        stops,
+        app_key=config.get(CONF_TFL_APP_KEY),
+        config_entry=config_entry,
+    )
     # Remove entities from the registry that belong to this config entry but
     # are no longer in the stop list (e.g. after the user removed a stop).
     registry = er.async_get(hass)
@@ -108,10 +152,20 @@ async def async_setup_entry(
         if entry.unique_id not in new_unique_ids:
             registry.async_remove(entry.entity_id)
 
-    platform = entity_platform.async_get_current_platform()
-    platform.async_register_entity_service("refresh_timetable", {}, "async_force_timetable_refresh")
+    for coordinator in coordinators:
+        config_entry.async_on_unload(coordinator.async_shutdown)
 
-    async_add_entities(sensors, update_before_add=True)
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        "refresh_timetable", {}, "async_force_timetable_refresh"
+    )
+
+    async_add_entities(sensors)
+    # First refreshes queue behind the rate limiter and must not hold up setup.
+    for coordinator in coordinators:
+        config_entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN} first refresh"
+        )
 
 
 async def async_setup_platform(
@@ -124,75 +178,73 @@ async def async_setup_platform(
     name = config.get(CONF_NAME)
     stops = config.get(CONF_STOPS)
 
-    sensors = []
-    for stop in stops:
-        if stop[CONF_STATION] is not None and stop[CONF_LINE] is not None:
-            shared_data = TfLData(
-                method=stop[CONF_METHOD],
-                line=stop[CONF_LINE],
-                station=stop[CONF_STATION],
-                nr_api_key=stop.get(CONF_NR_API_KEY),
-            )
-            common_kwargs = dict(
-                name=name,
-                method=stop[CONF_METHOD],
-                line=stop[CONF_LINE],
-                station=stop[CONF_STATION],
-                platform_filter=stop[CONF_PLATFORM],
-                max=stop[CONF_MAX],
-                shortenStationNames=stop[CONF_SHORTEN_STATION_NAMES],
-                nr_api_key=stop.get(CONF_NR_API_KEY),
-                tfl_data=shared_data,
-            )
-            sensors.append(LondonTfLSensor(departure_mode="realtime", **common_kwargs))
-            if stop[CONF_METHOD] != "national-rail":
-                sensors.append(LondonTfLSensor(departure_mode="scheduled", **common_kwargs))
-                sensors.append(LondonTfLSensor(departure_mode="all", **common_kwargs))
-    async_add_entities(sensors, update_before_add=True)
+    sensors, coordinators = _create_sensors(
+        hass, name, stops, app_key=config.get(CONF_TFL_APP_KEY)
+    )
+    async_add_entities(sensors)
+    for coordinator in coordinators:
+        hass.async_create_background_task(
+            coordinator.async_refresh(), f"{DOMAIN} first refresh"
+        )
 
 
-class LondonTfLSensor(SensorEntity):
+class LondonTfLSensor(CoordinatorEntity[LondonTfLCoordinator], SensorEntity):
     """Representation of a Sensor."""
 
+    # Bulky or ever-changing attributes that would bloat the recorder database.
+    _unrecorded_attributes = frozenset({"departures", "data", "line_colours"})
+
     def __init__(
         self,
+        coordinator: LondonTfLCoordinator,
         name,
-        method,
-        line,
-        station,
-        platform_filter,
-        max,
         shortenStationNames,
         *,
-        nr_api_key: Optional[str] = None,
         departure_mode: str = "realtime",
-        tfl_data: Optional[TfLData] = None,
+        attribute_formats=DEFAULT_ATTRIBUTE_FORMATS,
     ):
         """Initialize the sensor."""
+        super().__init__(coordinator)
+        tfl_data = coordinator.tfl_data
         self._platformname = name
         mode_suffix = "" if departure_mode == "realtime" else ("_" + departure_mode)
-        self._name = name + "_" + line + "_" + station + mode_suffix
-        self.entity_id = "sensor." + self._name.lower().replace(" ", "_").replace("-", "_")
-        self.method = method
-        self.line = line
-        self.station = station
-        self.filter_platform = platform_filter.strip() if platform_filter else ""
-        self.max_items = int(max)
+        self._name = name + "_" + tfl_data.line + "_" + tfl_data.station + mode_suffix
+        self.entity_id = "sensor." + self._name.lower().replace(" ", "_").replace(
+            "-", "_"
+        )
+        self.method = tfl_data.method
+        self.line = tfl_data.line
+        self.station = tfl_data.station
+        self.filter_platform = coordinator.filter_platform
+        self.max_items = coordinator.max_items
         self._shorten_station_names = shortenStationNames
         self.departure_mode = departure_mode
+        self.attribute_formats = frozenset(attribute_formats)
 
         self._state = None
         self._destination = ""
         self._departures = []
-        self._tfl_data = tfl_data or TfLData(
-            method=method, line=line, station=station, nr_api_key=nr_api_key
-        )
+        self._tfl_data = tfl_data
+        # Built once per coordinator update rather than on every state write.
+        self._attributes = self._build_attributes()
+        self._fingerprint = None
+        self._published_available = True
 
     @property
     def unique_id(self):
         filter_append = "" if not self.filter_platform else ("_" + self.filter_platform)
-        mode_suffix = "" if self.departure_mode == "realtime" else ("_" + self.departure_mode)
-        return self._platformname + "_" + self.line + "_" + self.station + filter_append + mode_suffix
+        mode_suffix = (
+            "" if self.departure_mode == "realtime" else ("_" + self.departure_mode)
+        )
+        return (
+            self._platformname
+            + "_"
+            + self.line
+            + "_"
+            + self.station
+            + filter_append
+            + mode_suffix
+        )
 
     @property
     def name(self) -> str:
@@ -208,9 +260,9 @@ class LondonTfLSensor(SensorEntity):
         }.get(self.departure_mode, "")
 
         if destination and station:
-            return "{0} to {1}{2}".format(station, destination, mode_suffix)
+            return f"{station} to {destination}{mode_suffix}"
         if station:
-            return "{0}{1}".format(station, mode_suffix)
+            return f"{station}{mode_suffix}"
         return self._name + mode_suffix
 
     @property
@@ -225,73 +277,95 @@ class LondonTfLSensor(SensorEntity):
         """Return the state of the sensor."""
         return self._state
 
-    async def async_update(self):
-        """Fetch new state data for the sensor.
-        This is the only method that should fetch new data for Home Assistant.
-        """
+    def _update_from_coordinator(self) -> bool:
+        """Copy this sensor's slice of the shared coordinator result.
 
-        if self._tfl_data.is_data_stale(self.max_items):
-            result = await self._tfl_data.fetch(self.hass)
-            if isinstance(result, str):
-                self._state = result
-                return
-            self._tfl_data.populate(result, self.filter_platform)
+        Returns False when nothing visible changed since the last update.
+        """
+        data = self.coordinator.data
+        if not data:
+            return False
+        departures = self._departures
+        if data["error"] is None:
+            departures = data["departures"].get(self.departure_mode, [])
+        fingerprint = (data["error"], departures_fingerprint(departures))
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+
+        if data["error"] is not None:
+            self._state = data["error"]
+            return True
+        self._departures = departures
+        self._state = self._tfl_data.get_state_from_departures(self._departures)
+        self._attributes = self._build_attributes()
+        return True
 
-        await self._tfl_data.fetch_timetable(self.hass)
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._update_from_coordinator()
 
-        self._tfl_data.sort_data(self.max_items)
-        self._departures = self._tfl_data.get_departures(self.departure_mode)
-        self._state = self._tfl_data.get_state_from_departures(self._departures)
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        available = self.available
+        # Unchanged predictions would only rewrite the same state to the recorder.
+        if self._update_from_coordinator() or available != self._published_available:
+            self._published_available = available
+            super()._handle_coordinator_update()
 
     async def async_force_timetable_refresh(self):
         """Force-refresh timetable data. Called via the refresh_timetable service."""
-        await self._tfl_data.fetch_timetable(self.hass, force=True)
-        self.async_write_ha_state()
+        await self.coordinator.async_force_timetable_refresh()
 
     @property
     def extra_state_attributes(self):
+        return self._attributes
+
+    def _build_attributes(self) -> dict:
+        # Only values that change with the departures belong here: the state is
+        # not written again while they stay the same (see _update_from_coordinator).
         attributes = {}
-        attributes["last_refresh"] = self._tfl_data.get_last_update()
         attributes["line_colours"] = self._tfl_data.get_line_colours()
 
         if not self._departures:
             return attributes
 
         departures = self._departures
-        attributes["departures"] = as_hasl_departures(departures)
-
-        data = [
-            {
-                "title_default": "To $title",
-                "line1_default": "at $time",
-                "line2_default": "$studio",
-                "line3_default": "",
-                "line4_default": "",
-                "icon": "mdi:train",
-            }
-        ]
-
-        for index, departure in enumerate(departures):
-            data.append(
-                {
-                    "title": departure["destination"],
-                    "airdate": departure["expected"],
-                    "fanart": get_line_image(self.line),
-                    "flag": True,
-                    "studio": departure["platform"],
-                }
-            )
+        first = departures[0]
+        attributes["expected"] = first["expected"]
+        attributes["destination"] = first["destination"]
+        attributes["platform"] = first["platform"]
+        self._destination = first["destination"]
+        attributes["next_departure_time"] = first["expected"]
 
-            if index == 0:
-                attributes["expected"] = departure["expected"]
-                attributes["destination"] = departure["destination"]
-                attributes["platform"] = departure["platform"]
-                self._destination = departure["destination"]
-
-                attributes["next_departure_minutes"] = departure["time"]
-                attributes["next_departure_time"] = departure["expected"]
+        listed = departures[:MAX_ATTRIBUTE_DEPARTURES]
+        if "hasl" in self.attribute_formats:
+            attributes["departures"] = as_hasl_departures(listed)
 
         attributes["station_name"] = self._tfl_data.get_station_name()
-        attributes["data"] = data
+
+        if "upcoming_media" in self.attribute_formats:
+            fanart = get_line_image(self.line)
+            data = [
+                {
+                    "title_default": "To $title",
+                    "line1_default": "at $time",
+                    "line2_default": "$studio",
+                    "line3_default": "",
+                    "line4_default": "",
+                    "icon": "mdi:train",
+                }
+            ]
+            for departure in listed:
+                data.append(
+                    {
+                        "title": departure["destination"],
+                        "airdate": departure["expected"],
+                        "fanart": fanart,
+                        "flag": True,
+                        "studio": departure["platform"],
+                    }
+                )
+            attributes["data"] = data
 
         return attributes
@@ -0,0 +1,110 @@
+"""
+Searchable index of the stop points known to the catalogue.
+
+The config flow shows a search step instead of a selector with every stop
+on a long line (bus routes and National Rail lines have hundreds). Stops
+match on their name, indicator or NaPTAN ID: prefixes first, then
+substrings. Close spellings are only offered when nothing matches directly.
+"""
+
+from __future__ import annotations
+
+import difflib
+import re
+
+# Lines with more stops than this get a search step before the selector.
+SEARCH_THRESHOLD = 40
+# Most matches offered in the selector after a search.
+SEARCH_LIMIT = 20
+# Minimum difflib ratio for a fuzzy match.
+FUZZY_CUTOFF = 0.8
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalise(text: str) -> str:
+    """Lower-case text and collapse punctuation and whitespace to single spaces."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _score(query: str, stop_id: str, text: str) -> float | None:
+    """Rank how well a stop matches query directly; lower is better, None if not."""
+    if text.startswith(query) or stop_id.startswith(query):
+        return 0.0
+    if f" {query}" in f" {text}":
+        return 1.0
+    if query in text or query in stop_id:
+        return 2.0
+    return None
+
+
+def _fuzzy_score(query: str, text: str) -> float | None:
+    words = text.split()
+    width = len(query.split())
+    # Compare against runs of as many words as the query, to forgive typos.
+    candidates = [
+        " ".join(words[i : i + width]) for i in range(max(1, len(words) - width + 1))
+    ]
+    ratio = max(difflib.SequenceMatcher(None, query, c).ratio() for c in candidates)
+    if ratio >= FUZZY_CUTOFF:
+        return 1 - ratio
+    return None
+
+
+class StopIndex:
+    """Stop labels keyed by ID, with the (mode, line) pairs that call there."""
+
+    def __init__(self) -> None:
+        # Stop ID -> (label, normalised label).
+        self._stops: dict[str, tuple[str, str]] = {}
+        self._lines: dict[tuple[str, str], set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._stops)
+
+    def add(self, method: str, line: str, stops: dict[str, str]) -> None:
+        """Index the stops of a line, replacing what was known for it."""
+        self._lines[(method, line)] = set(stops)
+        for stop_id, label in stops.items():
+            self._stops[stop_id] = (label, normalise(label))
+
+    def search(
+        self,
+        query: str,
+        *,
+        method: str | None = None,
+        line: str | None = None,
+        limit: int = SEARCH_LIMIT,
+    ) -> dict[str, str]:
+        """Return up to limit {stop ID: label}, best matches first.
+
+        method and line restrict the search to stops of that mode or line.
+        """
+        query = normalise(query)
+        if not query:
+            return {}
+
+        if method is None and line is None:
+            candidates = self._stops.keys()
+        else:
+            candidates = set()
+            for (mode, line_id), ids in self._lines.items():
+                if (method is None or mode == method) and (
+                    line is None or line_id == line
+                ):
+                    candidates |= ids
+
+        ranked = []
+        for stop_id in candidates:
+            label, text = self._stops[stop_id]
+            score = _score(query, stop_id.lower(), text)
+            if score is not None:
+                ranked.append((score, label, stop_id))
+        if not ranked:
+            for stop_id in candidates:
+                label, text = self._stops[stop_id]
+                score = _fuzzy_score(query, text)
+                if score is not None:
+                    ranked.append((score, label, stop_id))
+        ranked.sort()
+        return {stop_id: label for _, label, stop_id in ranked[:limit]}
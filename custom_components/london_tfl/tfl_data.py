@@ -1,22 +1,41 @@
-import json
+import heapq
 import logging
 import uuid
-from datetime import datetime, timedelta, UTC
-from dateutil import parser
-from functools import partial
-from typing import Optional, Union
+from datetime import UTC, datetime
 from zoneinfo import ZoneInfo
 
+from attr import dataclass
+from dateutil import parser
 
 from custom_components.london_tfl.codes import atco_to_crs
 from custom_components.london_tfl.const import (
-    TFL_TRANSPORT_TYPES,
+    DATA_FEEDS,
+    DATA_TIMETABLES,
     TFL_COLOUR_CODES,
-    TFL_TIMETABLE_URL,
     TFL_NR_LINE_TO_TOC,
+    TFL_TIMETABLE_URL,
+    TFL_TRANSPORT_TYPES,
     USE_LDBWS_URL,
 )
-from custom_components.london_tfl.network import LDBWS, LDBWSError, request
+from custom_components.london_tfl.decode import (
+    arrival_fields,
+    async_decode,
+    decode_arrivals,
+    decode_timetable,
+)
+from custom_components.london_tfl.network import (
+    LDBWSError,
+    async_acquire_ldbws,
+    async_release_ldbws,
+    get_session,
+    request,
+)
+from custom_components.london_tfl.ratelimit import PRIORITY_TIMETABLE
+from custom_components.london_tfl.timetable import (
+    TIMETABLE_MAX_AGE,
+    CompiledTimetable,
+    compile_timetable,
+)
 
 
 def get_destination(entry, use_destination_name=False):
@@ -32,67 +51,133 @@ def get_destination(entry, use_destination_name=False):
 _LOGGER = logging.getLogger(__name__)
 
 
-def time_to_station(entry, arrival, with_destination=True, style="{0}m {1}s"):
-    now = datetime.now(UTC)
-    arrival = parser.parse(arrival).replace(tzinfo=UTC)
-    next_departure_time = (arrival - now).total_seconds()
-    next_departure_dest = get_destination(entry, True)
-    return style.format(
-        int(next_departure_time / 60), int(next_departure_time % 60)
-    ) + (" to " + next_departure_dest if with_destination else "")
+def scheduled_only(departures: list) -> list:
+    """Keep only departures present in the timetable."""
+    return [
+        d for d in departures
+        if d["prediction_type"] in ("scheduled", "scheduled+realtime")
+    ]
+
+
+def departures_fingerprint(departures: list) -> tuple:
+    """Return what a user can see of departures, ignoring the passing of time.
+
+    Departures carry no countdowns, so two polls with the same predictions
+    have the same fingerprint and need no new state.
+    """
+    return tuple(
+        (d["expected"], d["destination"], d["platform"], d.get("prediction_type"))
+        for d in departures
+    )
+
+
+def parse_timestamp(value: str) -> float | None:
+    """Return epoch seconds for an ISO 8601 time from TfL or LDBWS, or None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = parser.parse(value)
+        except (ValueError, OverflowError):
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed.timestamp()
+
+
+@dataclass(slots=True, frozen=True)
+class Arrival:
+    """A prediction reduced to the fields we use, with its times parsed once."""
+
+    arrival: float
+    expected_arrival: str
+    expected_departure: str
+    platform: str
+    destination: str
+    station_name: str
 
 
 class TfLData:
     def __init__(
-        self, *, method: str, line: str, station: str, nr_api_key: Optional[str] = None
+        self,
+        *,
+        method: str,
+        line: str,
+        station: str,
+        nr_api_key: str | None = None,
+        cache_buster: bool = False,
+        app_key: str | None = None,
     ):
         self._raw_result = []
         self._last_update = None
-        self._api_json = []
+        self._arrivals = []
         self._station_name = ""
         self.method = method
         self.line = line
         self.station = station
         self.nr_api_key = nr_api_key
-        self.__ldbws_client = None  # initialized lazily
-        self._timetable_json = None
+        # Append a random query parameter to arrivals requests to defeat any HTTP
+        # caching.
+        self.cache_buster = cache_buster
+        self.app_key = app_key
+        self.__ldbws_client = None  # shared per token, acquired lazily
+        self.__ldbws_crs = None  # station whose shared board this stop subscribed to
+        self._timetable: CompiledTimetable | None = None
         self._timetable_last_fetch = None
 
-    async def fetch(self, hass) -> Union[str, list]:
-        url = self.url(station=self.station, test=str(uuid.uuid4()))
+    async def fetch(self, hass) -> str | list:
+        test = str(uuid.uuid4()) if self.cache_buster else ""
+        url = self.url(station=self.station, test=test)
         if url == USE_LDBWS_URL:
             return await self._fetch_ldbws(hass)
 
+        feeds = hass.data.get(DATA_FEEDS) if hass is not None else None
+        if feeds is not None:
+            result = await feeds.async_fetch(hass, self)
+            if result is not None:
+                return result
+
         try:
             result = await request(
                 url,
+                key=self.url(station=self.station),
+                session=get_session(hass),
+                use_cache=not self.cache_buster,
+                app_key=self.app_key,
             )
             if not result:
                 _LOGGER.warning("There was no reply from TfL servers for %s", url)
                 return "Cannot reach TfL"
-            return json.loads(result)
-        except json.JSONDecodeError:
+            fields = arrival_fields(self.transport_type())
+            return await async_decode(hass, result, decode_arrivals, fields)
+        except ValueError:
             _LOGGER.exception("Failed to interpret received JSON for %s", url)
             return "Cannot interpret JSON from TfL"
         except OSError:
             _LOGGER.exception("Internal error during request to %s", url)
             return "Cannot reach TfL"
 
-    async def _fetch_ldbws(self, hass) -> Union[str, list]:
+    async def _fetch_ldbws(self, hass) -> str | list:
         if self.nr_api_key is None:
             _LOGGER.warning(
-                "Legacy National Rail sensor detected, please recreate to access departure times"
+                "Legacy National Rail sensor detected, "
+                "please recreate to access departure times"
             )
             return "Please recreate this entity to access National Rail departure times"
 
         if self.__ldbws_client is None:
-            self.__ldbws_client = await hass.async_add_executor_job(
-                partial(LDBWS, token=self.nr_api_key)
-            )
+            self.__ldbws_client = await async_acquire_ldbws(hass, self.nr_api_key)
         try:
             code = await atco_to_crs(hass, self.station)
             _LOGGER.debug("Found code for station %s: %s", self.station, code)
-            result = await self.__ldbws_client.get_departures(code)
+            if self.__ldbws_crs != code:
+                if self.__ldbws_crs is not None:
+                    self.__ldbws_client.unsubscribe(self.__ldbws_crs)
+                self.__ldbws_client.subscribe(code)
+                self.__ldbws_crs = code
+            result = await self.__ldbws_client.get_board(code)
             _LOGGER.debug("Received LDBWS response: %s", result)
         except LDBWSError:
             _LOGGER.exception("Failed to get departures for %s", self.station)
@@ -101,7 +186,10 @@ class TfLData:
             _LOGGER.exception("Invalid station code for %s", self.station)
             return "Cannot fetch station code"
         except Exception:
-            _LOGGER.exception("Unexpected error fetching National Rail departures for %s", self.station)
+            _LOGGER.exception(
+                "Unexpected error fetching National Rail departures for %s",
+                self.station,
+            )
             return "National Rail fetch error"
 
         toc = TFL_NR_LINE_TO_TOC.get(self.line)
@@ -112,36 +200,85 @@ class TfLData:
 
         if not filtered and result:
             _LOGGER.warning(
-                "No departures matched operator filter for line %r (TOC=%r); returning all %d trains",
-                self.line, toc, len(result),
+                "No departures matched operator filter for line %r (TOC=%r); "
+                "returning all %d trains",
+                self.line,
+                toc,
+                len(result),
             )
             filtered = [e.convert() for e in result]
 
         return filtered
 
+    async def async_close(self) -> None:
+        """Release the shared LDBWS client, if this stop acquired one."""
+        if self.__ldbws_client is not None:
+            if self.__ldbws_crs is not None:
+                self.__ldbws_client.unsubscribe(self.__ldbws_crs)
+                self.__ldbws_crs = None
+            self.__ldbws_client = None
+            await async_release_ldbws(self.nr_api_key)
+
     async def fetch_timetable(self, hass, force: bool = False) -> bool:
         """Fetch timetable data. Returns True if timetable is available."""
         if self.method == "national-rail":
             return False
 
+        store = hass.data.get(DATA_TIMETABLES) if hass is not None else None
+        if self._timetable_last_fetch is None and store is not None:
+            stored = store.get(self.line, self.station)
+            if stored is not None:
+                self._timetable, fetched = stored
+                self._timetable_last_fetch = datetime.fromtimestamp(fetched)
+
         now = datetime.now()
         if (
             not force
             and self._timetable_last_fetch is not None
-            and (now - self._timetable_last_fetch).total_seconds() < 3 * 24 * 3600
+            and (now - self._timetable_last_fetch).total_seconds() < TIMETABLE_MAX_AGE
         ):
-            return self._timetable_json is not None
-
+            return self._timetable is not None
+
+        if store is None:
+            return await self._download_timetable(hass, None, force, now)
+        # Stations of a line wait for each other so they can share a route timetable.
+        async with store.route_lock(self.line):
+            if not force:
+                cached = store.route_for(self.line, self.station)
+                if cached is not None:
+                    timetable_json, fetched = cached
+                    self._timetable = compile_timetable(timetable_json, self.station)
+                    self._timetable_last_fetch = datetime.fromtimestamp(fetched)
+                    if self._timetable is not None:
+                        store.put(self.line, self.station, self._timetable, fetched)
+                        return True
+            return await self._download_timetable(hass, store, force, now)
+
+    async def _download_timetable(
+        self, hass, store, force: bool, now: datetime
+    ) -> bool:
         url = TFL_TIMETABLE_URL.format(self.line, self.station)
         try:
-            result = await request(url)
+            result = await request(
+                url,
+                session=get_session(hass),
+                use_cache=not force,
+                priority=PRIORITY_TIMETABLE,
+                app_key=self.app_key,
+            )
             if result:
-                parsed = json.loads(result)
-                if not isinstance(parsed, dict):
+                try:
+                    parsed = await async_decode(hass, result, decode_timetable)
+                except ValueError:
                     _LOGGER.warning("Unexpected timetable response format from %s", url)
                     return False
-                self._timetable_json = parsed
+                self._timetable = compile_timetable(parsed, self.station)
                 self._timetable_last_fetch = now
+                if self._timetable is None:
+                    return False
+                if store is not None:
+                    store.add_route(self.line, parsed, now.timestamp())
+                    store.put(self.line, self.station, self._timetable, now.timestamp())
                 return True
         except Exception:
             _LOGGER.warning("Failed to fetch timetable from %s", url, exc_info=True)
@@ -149,105 +286,73 @@ class TfLData:
 
     def set_timetable(self, timetable_json: dict) -> None:
         """Set timetable data directly (e.g. from a local file for testing)."""
-        self._timetable_json = timetable_json
+        self._timetable = compile_timetable(timetable_json, self.station)
         self._timetable_last_fetch = datetime.now()
 
     def _get_scheduled_departures_today(self) -> list:
-        """Parse timetable and return today's scheduled departures as (datetime_utc, towards) pairs."""
-        if not self._timetable_json:
-            return []
+        """Return today's scheduled departures in the next hour.
 
-        try:
-            return self._parse_scheduled_departures_today()
-        except Exception:
-            _LOGGER.warning("Failed to parse timetable data", exc_info=True)
-            return []
-
-    def _parse_scheduled_departures_today(self) -> list:
-        timetable = self._timetable_json.get("timetable", {})
-        routes = timetable.get("routes", [])
-        if not routes:
+        Each is a (datetime_utc, towards) pair.
+        """
+        if not self._timetable:
             return []
 
-        departure_stop_id = timetable.get("departureStopId", "")
-        interval_offset = 0.0
-        if departure_stop_id != self.station:
-            for si in routes[0].get("stationIntervals", []):
-                for interval in si.get("intervals", []):
-                    if interval["stopId"] == self.station:
-                        interval_offset = float(interval["timeToArrival"])
-                        break
-                if interval_offset:
-                    break
-
-        towards = ""
-        for stop in self._timetable_json.get("stops", []):
-            if stop.get("id") == self.station:
-                towards = stop.get("towards", "")
-                break
-        if not towards:
-            for stop in self._timetable_json.get("stations", []):
-                if stop.get("id") == self.station:
-                    towards = stop.get("towards", "")
-                    break
-
         now_london = datetime.now(ZoneInfo("Europe/London"))
-        weekday = now_london.weekday()
-        if weekday < 5:
-            schedule_name = "Monday to Friday"
-        elif weekday == 5:
-            schedule_name = "Saturday"
-        else:
-            schedule_name = "Sunday"
-
-        schedules = routes[0].get("schedules", [])
-        target_schedule = next(
-            (s for s in schedules if s["name"] == schedule_name),
-            schedules[0] if schedules else None,
+        now = now_london.timestamp()
+        return self._timetable.departures_between(now_london, now - 60, now + 3600)
+
+    def next_arrival(self) -> float | None:
+        """Return the epoch time of the next predicted arrival, if any."""
+        now = datetime.now(UTC).timestamp()
+        return min(
+            (item.arrival for item in self._raw_result if item.arrival > now),
+            default=None,
         )
-        if not target_schedule:
-            return []
 
-        now_utc = datetime.now(UTC)
-        window_start = now_utc.timestamp() - 60
-        window_end = now_utc.timestamp() + 3600
-
-        result = []
-        for journey in target_schedule.get("knownJourneys", []):
-            hour = int(journey["hour"])
-            minute = int(journey["minute"])
-            # Hours >= 24 represent times past midnight on the following day
-            if hour >= 24:
-                dt_london = now_london.replace(hour=hour - 24, minute=minute, second=0, microsecond=0) + timedelta(days=1)
-            else:
-                dt_london = now_london.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            if interval_offset:
-                dt_london = dt_london + timedelta(minutes=interval_offset)
-            dt_utc = dt_london.astimezone(UTC)
-            ts = dt_utc.timestamp()
-            if window_start <= ts <= window_end:
-                result.append((dt_utc, towards))
-
-        return result
+    def has_timetable(self) -> bool:
+        return self._timetable is not None
+
+    def next_scheduled_departure(self) -> float | None:
+        """Return the epoch time of the next timetabled departure, if any."""
+        if not self._timetable:
+            return None
+        return self._timetable.next_departure(datetime.now(ZoneInfo("Europe/London")))
 
     def populate(self, json_data, filter_platform):
-        self._raw_result = json_data
+        self._raw_result = self._to_arrivals(json_data)
         self.filter_by_platform(filter_platform)
         self._last_update = datetime.now()
 
+    def _to_arrivals(self, json_data) -> list[Arrival]:
+        method = self._method_property(TFL_TRANSPORT_TYPES)
+        use_destination_name = TFL_TRANSPORT_TYPES[method]["use_destination_name"]
+        arrivals = []
+        for item in json_data:
+            expected_arrival = self._get_expected_arrival(item)
+            expected_departure = self._get_expected_departure(item)
+            arrival = parse_timestamp(expected_arrival)
+            if arrival is None:
+                _LOGGER.debug(
+                    "Skipping prediction without a valid arrival time: %s", item
+                )
+                continue
+            arrivals.append(
+                Arrival(
+                    arrival=arrival,
+                    expected_arrival=expected_arrival,
+                    expected_departure=expected_departure,
+                    platform=self._get_platform_name(item),
+                    destination=get_destination(item, use_destination_name),
+                    station_name=item.get("stationName", ""),
+                )
+            )
+        return arrivals
+
     def is_data_stale(self, max_items):
         if len(self._raw_result) > 0:
             # check if there are enough already stored to skip a request
-            now = datetime.now().timestamp()
-            after_now = []
-            try:
-                after_now = [
-                    item
-                    for item in self._raw_result
-                    if parser.parse(self._get_expected_arrival(item)).timestamp() > now
-                ]
-            except Exception:
-                after_now = []
+            now = datetime.now(UTC).timestamp()
+            after_now = [item for item in self._raw_result if item.arrival > now]
 
             if len(after_now) >= max_items:
                 self._raw_result = after_now
@@ -257,27 +362,27 @@ class TfLData:
     def filter_by_platform(self, filter_platform):
         if filter_platform != "":
             self._raw_result = [
-                item
-                for item in self._raw_result
-                if filter_platform in self._get_platform_name(item)
+                item for item in self._raw_result if filter_platform in item.platform
             ]
 
     def sort_data(self, max_items):
-        self._api_json = sorted(
-            self._raw_result, key=self._get_expected_arrival, reverse=False
+        self._arrivals = sorted(
+            self._raw_result, key=lambda item: item.arrival
         )[:max_items]
 
     def get_state(self):
-        if len(self._api_json) > 0:
-            return (
-                parser.parse(self._get_expected_arrival(self._api_json[0]))
-                .astimezone(ZoneInfo("Europe/London"))
-                .strftime("%H:%M")
-            )
+        if len(self._arrivals) > 0:
+            return datetime.fromtimestamp(
+                self._arrivals[0].arrival, ZoneInfo("Europe/London")
+            ).strftime("%H:%M")
         return "None"
 
     def is_empty(self):
-        return len(self._api_json) == 0
+        return len(self._arrivals) == 0
+
+    def transport_type(self) -> dict:
+        """Return this stop's TFL_TRANSPORT_TYPES entry."""
+        return TFL_TRANSPORT_TYPES[self._method_property(TFL_TRANSPORT_TYPES)]
 
     def _method_property(self, const) -> str:
         method = self.method
@@ -304,109 +409,83 @@ class TfLData:
         template = TFL_TRANSPORT_TYPES[method]["url"]
         return template.format(self.line, station, test)
 
+    def _realtime_departure(self, item: Arrival, prediction_type: str) -> dict:
+        method = self._method_property(TFL_TRANSPORT_TYPES)
+        return {
+            "platform": item.platform,
+            "line": item.platform,
+            "direction": 0,
+            "departure": item.expected_departure,
+            "destination": item.destination,
+            "expected": item.expected_arrival,
+            "type": TFL_TRANSPORT_TYPES[method]["transport_type"],
+            "groupofline": "",
+            "icon": TFL_TRANSPORT_TYPES[method]["icon"],
+            "prediction_type": prediction_type,
+        }
+
     def _compute_all_departures(self):
         scheduled = self._get_scheduled_departures_today()
+        scheduled_ts = [sched_dt.timestamp() for sched_dt, _ in scheduled]
         matched_scheduled_indices = set()
 
         method = self._method_property(TFL_TRANSPORT_TYPES)
-        use_destination_name = TFL_TRANSPORT_TYPES[method]["use_destination_name"]
         transport_type = TFL_TRANSPORT_TYPES[method]["transport_type"]
         icon = TFL_TRANSPORT_TYPES[method]["icon"]
 
-        departures = []
-        for item in self._api_json:
-            expected_departure = self._get_expected_departure(item)
-            expected_arrival = self._get_expected_arrival(item)
-            platform = self._get_platform_name(item)
-
+        # Both lists are sorted by time, so a single forward pointer finds, for
+        # each prediction, the earliest scheduled departure within 3 minutes.
+        realtime = []
+        j = 0
+        for item in self._arrivals:
+            while j < len(scheduled_ts) and scheduled_ts[j] < item.arrival - 180:
+                j += 1
             prediction_type = "realtime"
-            if scheduled:
-                try:
-                    arrival_dt = parser.parse(expected_arrival).replace(tzinfo=UTC)
-                    for i, (sched_dt, _) in enumerate(scheduled):
-                        if abs((arrival_dt - sched_dt).total_seconds()) <= 180:
-                            prediction_type = "scheduled+realtime"
-                            matched_scheduled_indices.add(i)
-                            break
-                except Exception:
-                    pass
+            if j < len(scheduled_ts) and scheduled_ts[j] <= item.arrival + 180:
+                prediction_type = "scheduled+realtime"
+                matched_scheduled_indices.add(j)
 
-            departure = {
-                "time_to_station": time_to_station(item, expected_arrival, False),
-                "platform": platform,
-                "line": platform,
-                "direction": 0,
-                "departure": expected_departure,
-                "destination": get_destination(item, use_destination_name),
-                "time": time_to_station(item, expected_departure, False, "{0}"),
-                "expected": expected_arrival,
-                "type": transport_type,
-                "groupofline": "",
-                "icon": icon,
-                "prediction_type": prediction_type,
-            }
-            departures.append(departure)
+            realtime.append(
+                (item.arrival, self._realtime_departure(item, prediction_type))
+            )
 
             if len(self._station_name) == 0:
-                self._station_name = item.get("stationName", "")
+                self._station_name = item.station_name
 
+        unmatched = []
         for i, (sched_dt, towards) in enumerate(scheduled):
             if i in matched_scheduled_indices:
                 continue
             sched_iso = sched_dt.isoformat()
-            fake_item = {"towards": towards, "destinationName": towards}
+            sched_ts = scheduled_ts[i]
             departure = {
-                "time_to_station": time_to_station(fake_item, sched_iso, False),
                 "platform": self.line,
                 "line": self.line,
                 "direction": 0,
                 "departure": sched_iso,
                 "destination": towards,
-                "time": time_to_station(fake_item, sched_iso, False, "{0}"),
                 "expected": sched_iso,
                 "type": transport_type,
                 "groupofline": "",
                 "icon": icon,
                 "prediction_type": "scheduled",
             }
-            departures.append(departure)
+            unmatched.append((sched_ts, departure))
 
-        departures.sort(key=lambda d: d["expected"])
-        return departures
+        return [
+            departure
+            for _, departure in heapq.merge(realtime, unmatched, key=lambda d: d[0])
+        ]
 
     def _compute_realtime_departures(self):
-        """Build departures directly from the realtime API result, no timetable involvement."""
-        method = self._method_property(TFL_TRANSPORT_TYPES)
-        use_destination_name = TFL_TRANSPORT_TYPES[method]["use_destination_name"]
-        transport_type = TFL_TRANSPORT_TYPES[method]["transport_type"]
-        icon = TFL_TRANSPORT_TYPES[method]["icon"]
-
+        """Build departures from the realtime API result alone, without timetables."""
         departures = []
-        for item in self._api_json:
-            expected_departure = self._get_expected_departure(item)
-            expected_arrival = self._get_expected_arrival(item)
-            platform = self._get_platform_name(item)
-
-            departure = {
-                "time_to_station": time_to_station(item, expected_arrival, False),
-                "platform": platform,
-                "line": platform,
-                "direction": 0,
-                "departure": expected_departure,
-                "destination": get_destination(item, use_destination_name),
-                "time": time_to_station(item, expected_departure, False, "{0}"),
-                "expected": expected_arrival,
-                "type": transport_type,
-                "groupofline": "",
-                "icon": icon,
-                "prediction_type": "realtime",
-            }
-            departures.append(departure)
+        for item in self._arrivals:
+            departures.append(self._realtime_departure(item, "realtime"))
 
             if len(self._station_name) == 0:
-                self._station_name = item.get("stationName", "")
+                self._station_name = item.station_name
 
-        departures.sort(key=lambda d: d["expected"])
         return departures
 
     def get_departures(self, mode: str = "all"):
@@ -421,17 +500,17 @@ class TfLData:
             return self._compute_realtime_departures()
         all_departures = self._compute_all_departures()
         if mode == "scheduled":
-            return [d for d in all_departures if d["prediction_type"] in ("scheduled", "scheduled+realtime")]
+            return scheduled_only(all_departures)
         return all_departures
 
     def get_state_from_departures(self, departures: list) -> str:
         """Return HH:MM state string from the first entry in a departures list."""
         if departures:
-            return (
-                parser.parse(departures[0]["expected"])
-                .astimezone(ZoneInfo("Europe/London"))
-                .strftime("%H:%M")
-            )
+            expected = parse_timestamp(departures[0]["expected"])
+            if expected is not None:
+                return datetime.fromtimestamp(
+                    expected, ZoneInfo("Europe/London")
+                ).strftime("%H:%M")
         return "None"
 
     def get_station_name(self):
@@ -0,0 +1,273 @@
+"""
+Compiled timetables for a single station.
+
+The TfL timetable response lists every journey of the route as hour/minute
+pairs at the route's departure stop, each following one of the route's
+intervals (its sequence of stops). Compiling it keeps the journeys whose
+interval calls at the station, applies that interval's offset once and
+keeps, per schedule (day type), a sorted list of minutes after local
+midnight, so looking up the departures in a window is two bisects instead of
+a walk over the whole response.
+
+Compiled timetables are persisted with Home Assistant's storage helper so a
+restart does not download them all again.
+
+A route timetable also lists the interval from its departure stop to every
+later stop on the route, so the store keeps the route timetables downloaded
+for each line in memory and compiles other stations on the same route from
+them, instead of downloading a timetable per station.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+from datetime import UTC, datetime, timedelta
+
+from attr import dataclass
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_TIMETABLES, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# A fetched timetable is trusted for this long before it is downloaded again.
+TIMETABLE_MAX_AGE = 3 * 24 * 3600
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.timetables"
+# Coalesce writes when many stations refresh their timetables together.
+STORAGE_SAVE_DELAY = 30
+
+
+def schedule_name(now_london: datetime) -> str:
+    """Return the TfL schedule name that applies on the day of now_london."""
+    weekday = now_london.weekday()
+    if weekday < 5:
+        return "Monday to Friday"
+    if weekday == 5:
+        return "Saturday"
+    return "Sunday"
+
+
+@dataclass(slots=True)
+class CompiledTimetable:
+    towards: str
+    # Schedule name -> sorted departure minutes after local midnight, offset applied.
+    # Values past 1440 are departures after midnight on the following day.
+    schedules: dict[str, list[float]]
+
+    def as_dict(self) -> dict:
+        return {"towards": self.towards, "schedules": self.schedules}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CompiledTimetable:
+        return cls(towards=data["towards"], schedules=dict(data["schedules"]))
+
+    def minutes_for(self, now_london: datetime) -> list[float]:
+        """Return the departure minutes of the schedule running on now_london's day."""
+        minutes = self.schedules.get(schedule_name(now_london))
+        if minutes is None:
+            # Same fallback as the raw timetable: use the first schedule listed.
+            minutes = next(iter(self.schedules.values()), [])
+        return minutes
+
+    def departures_between(
+        self, now_london: datetime, start: float, end: float
+    ) -> list[tuple[datetime, str]]:
+        """Return (datetime_utc, towards) for today's departures in [start, end]."""
+        minutes = self.minutes_for(now_london)
+        if not minutes:
+            return []
+
+        midnight = now_london.replace(hour=0, minute=0, second=0, microsecond=0)
+        start_minute = (start - midnight.timestamp()) / 60
+        end_minute = (end - midnight.timestamp()) / 60
+        # Wall-clock minutes drift from elapsed minutes by up to an hour on
+        # DST changes, so bisect a slightly wider range and filter exactly.
+        lo = bisect.bisect_left(minutes, start_minute - 60)
+        hi = bisect.bisect_right(minutes, end_minute + 60)
+
+        result = []
+        for minute in minutes[lo:hi]:
+            dt_utc = (midnight + timedelta(minutes=minute)).astimezone(UTC)
+            if start <= dt_utc.timestamp() <= end:
+                result.append((dt_utc, self.towards))
+        return result
+
+    def next_departure(self, now_london: datetime) -> float | None:
+        """Return the epoch time of the first departure after now_london, if any.
+
+        Looks at today's schedule and then tomorrow's.
+        """
+        now = now_london.timestamp()
+        midnight = now_london.replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in (0, 1):
+            day_start = midnight + timedelta(days=day)
+            minutes = self.minutes_for(day_start)
+            lo = bisect.bisect_left(minutes, (now - day_start.timestamp()) / 60 - 60)
+            for minute in minutes[lo:]:
+                ts = (day_start + timedelta(minutes=minute)).timestamp()
+                if ts > now:
+                    return ts
+        return None
+
+
+def _interval_offsets(timetable: dict, route: dict, station: str) -> dict | None:
+    """Return {interval id: minutes from the departure stop} for the route's
+    intervals calling at station; None if station is the departure stop."""
+    if timetable.get("departureStopId", "") == station:
+        return None
+    offsets: dict[str, float] = {}
+    for si in route.get("stationIntervals", []):
+        for interval in si.get("intervals", []):
+            if interval.get("stopId") != station:
+                continue
+            try:
+                offsets[str(si.get("id"))] = float(interval["timeToArrival"])
+            except (KeyError, TypeError, ValueError):
+                _LOGGER.debug("Interval %s has no time to %s", si.get("id"), station)
+            break
+    return offsets
+
+
+def _towards(timetable_json: dict, station: str) -> str:
+    for key in ("stops", "stations"):
+        for stop in timetable_json.get(key, []):
+            if stop.get("id") == station:
+                towards = stop.get("towards", "")
+                if towards:
+                    return towards
+                break
+    return ""
+
+
+def serves_station(timetable_json: dict, station: str) -> bool:
+    """Whether station can be compiled from timetable_json: it is the departure
+    stop or an interval of the route compile_timetable uses calls at it."""
+    timetable = timetable_json.get("timetable", {})
+    routes = timetable.get("routes", [])
+    if not routes:
+        return False
+    return _interval_offsets(timetable, routes[0], station) != {}
+
+
+def compile_timetable(timetable_json: dict, station: str) -> CompiledTimetable | None:
+    """Compile a TfL timetable response for station; None if it has no routes."""
+    timetable = timetable_json.get("timetable", {})
+    routes = timetable.get("routes", [])
+    if not routes:
+        return None
+
+    offsets = _interval_offsets(timetable, routes[0], station)
+    schedules: dict[str, list[float]] = {}
+    for schedule in routes[0].get("schedules", []):
+        if schedule["name"] in schedules:
+            continue
+        minutes = []
+        for journey in schedule.get("knownJourneys", []):
+            if offsets is None:
+                offset = 0.0
+            else:
+                # Journeys on intervals that do not call at station are skipped.
+                offset = offsets.get(str(journey.get("intervalId")))
+                if offset is None:
+                    continue
+            minutes.append(int(journey["hour"]) * 60 + int(journey["minute"]) + offset)
+        schedules[schedule["name"]] = sorted(minutes)
+    return CompiledTimetable(
+        towards=_towards(timetable_json, station), schedules=schedules
+    )
+
+
+class TimetableStore:
+    """Compiled timetables persisted across restarts, keyed by line and station.
+
+    Also holds, in memory only, the route timetables downloaded per line.
+    """
+
+    def __init__(self, hass) -> None:
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._timetables: dict[str, dict] = {}
+        # Line -> [(fetch time, route timetable)], one per departure stop.
+        self._routes: dict[str, list[tuple[float, dict]]] = {}
+        self._route_locks: dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def _key(line: str, station: str) -> str:
+        return f"{line}/{station}"
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load() or {}
+        now = time.time()
+        # Expired entries would be refetched anyway, so drop them on load.
+        self._timetables = {
+            key: entry
+            for key, entry in data.get("timetables", {}).items()
+            if now - entry["fetched"] < TIMETABLE_MAX_AGE
+        }
+        _LOGGER.debug("Loaded %d stored timetables", len(self._timetables))
+
+    def get(self, line: str, station: str) -> tuple[CompiledTimetable, float] | None:
+        """Return the stored timetable and its fetch time (epoch seconds), if any."""
+        entry = self._timetables.get(self._key(line, station))
+        if entry is None:
+            return None
+        try:
+            return CompiledTimetable.from_dict(entry["timetable"]), entry["fetched"]
+        except (KeyError, TypeError):
+            _LOGGER.warning(
+                "Ignoring malformed stored timetable for %s %s", line, station
+            )
+            return None
+
+    def put(
+        self, line: str, station: str, timetable: CompiledTimetable, fetched: float
+    ) -> None:
+        self._timetables[self._key(line, station)] = {
+            "fetched": fetched,
+            "timetable": timetable.as_dict(),
+        }
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        return {"timetables": self._timetables}
+
+    def route_lock(self, line: str) -> asyncio.Lock:
+        """Lock held while a station of line looks up or downloads its route."""
+        return self._route_locks.setdefault(line, asyncio.Lock())
+
+    def route_for(self, line: str, station: str) -> tuple[dict, float] | None:
+        """Return a route timetable of line serving station, and its fetch time."""
+        now = time.time()
+        for fetched, timetable_json in self._routes.get(line, []):
+            if now - fetched < TIMETABLE_MAX_AGE and serves_station(
+                timetable_json, station
+            ):
+                return timetable_json, fetched
+        return None
+
+    def add_route(self, line: str, timetable_json: dict, fetched: float) -> None:
+        """Keep a downloaded route timetable, replacing older ones from its stop."""
+        departure_stop = timetable_json.get("timetable", {}).get("departureStopId", "")
+        now = time.time()
+        routes = [
+            (ts, route)
+            for ts, route in self._routes.get(line, [])
+            if now - ts < TIMETABLE_MAX_AGE
+            and route.get("timetable", {}).get("departureStopId", "") != departure_stop
+        ]
+        routes.append((fetched, timetable_json))
+        self._routes[line] = routes
+
+
+async def async_setup_timetable_store(hass) -> TimetableStore:
+    """Load the persisted timetables once per Home Assistant run."""
+    store = hass.data.get(DATA_TIMETABLES)
+    if store is None:
+        store = TimetableStore(hass)
+        await store.async_load()
+        hass.data[DATA_TIMETABLES] = store
+    return store
@@ -0,0 +1,94 @@
+import json
+import time
+
+import pytest
+
+from custom_components.london_tfl import catalogue
+from custom_components.london_tfl.catalogue import (
+    CATALOGUE_TTL,
+    Catalogue,
+    async_get_catalogue,
+    parse_stations,
+)
+
+LINES = [{"id": "jubilee", "name": "Jubilee"}, {"id": "dlr", "name": "DLR"}]
+
+
+class ResponseList(list):
+    calls: list
+
+
+@pytest.fixture
+def responses(monkeypatch) -> ResponseList:
+    responses = ResponseList()
+    responses.calls = []
+
+    async def fake_request(url, **kwargs):
+        responses.calls.append(url)
+        return responses.pop(0) if responses else None
+
+    monkeypatch.setattr(catalogue, "request", fake_request)
+    return responses
+
+
+class TestParseStations:
+    DATA = [
+        {"id": "490000001A", "stationNaptan": "940GZZLUSTD", "commonName": "Stratford"}
+    ]
+
+    def test_rail_uses_station_naptan(self) -> None:
+        assert parse_stations(self.DATA, "tube") == {"940GZZLUSTD": "Stratford"}
+
+    def test_bus_uses_stop_id(self) -> None:
+        assert parse_stations(self.DATA, "bus") == {"490000001A": "Stratford"}
+
+
+class TestCatalogue:
+    async def test_cached_within_ttl(self, hass, responses: ResponseList) -> None:
+        responses.append(json.dumps(LINES))
+        cat = await async_get_catalogue(hass)
+        assert await cat.async_lines("tube") == {"jubilee": "Jubilee", "dlr": "DLR"}
+        assert await cat.async_lines("tube") == {"jubilee": "Jubilee", "dlr": "DLR"}
+        assert len(responses.calls) == 1
+        assert await async_get_catalogue(hass) is cat
+
+    async def test_expired_entry_served_when_tfl_down(
+        self, hass, responses: ResponseList
+    ) -> None:
+        cat = Catalogue(hass)
+        cat._entries["lines/tube"] = {
+            "fetched": time.time() - CATALOGUE_TTL - 1,
+            "items": {"jubilee": "Jubilee"},
+        }
+        assert await cat.async_lines("tube") == {"jubilee": "Jubilee"}
+        assert len(responses.calls) == 1
+
+    async def test_expired_entry_refreshed(self, hass, responses: ResponseList) -> None:
+        cat = Catalogue(hass)
+        cat._entries["lines/tube"] = {"fetched": 0, "items": {"jubilee": "Jubilee"}}
+        responses.append(json.dumps(LINES[1:]))
+        assert await cat.async_lines("tube") == {"dlr": "DLR"}
+
+    async def test_nothing_cached_and_tfl_down(
+        self, hass, responses: ResponseList
+    ) -> None:
+        assert await Catalogue(hass).async_lines("tube") == {}
+
+    async def test_loaded_from_storage(
+        self, hass, hass_storage, responses: ResponseList
+    ) -> None:
+        hass_storage[catalogue.STORAGE_KEY] = {
+            "version": 1,
+            "key": catalogue.STORAGE_KEY,
+            "data": {
+                "entries": {
+                    "stations/bus/241": {
+                        "fetched": time.time(),
+                        "items": {"490000001A": "Stratford"},
+                    }
+                }
+            },
+        }
+        cat = await async_get_catalogue(hass)
+        assert await cat.async_stations("bus", "241") == {"490000001A": "Stratford"}
+        assert responses.calls == []
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+from custom_components.london_tfl import codes
+
+
+@pytest.fixture
+def letter_loads(monkeypatch) -> list:
+    loads = []
+
+    async def load_letter(hass, letter):
+        loads.append(letter)
+        await asyncio.sleep(0)
+        return {"ABWD": "ABW", "ACTNMLJ": "AML"}
+
+    async def no_tfl(hass, atco):
+        return None
+
+    monkeypatch.setattr(codes, "_load_letter", load_letter)
+    monkeypatch.setattr(codes, "_tfl_api_crs", no_tfl)
+    return loads
+
+
+class TestAtcoToCrs:
+    async def test_concurrent_misses_load_letter_once(
+        self, hass, letter_loads: list
+    ) -> None:
+        results = await asyncio.gather(
+            codes.atco_to_crs(hass, "9100ABWD"),
+            codes.atco_to_crs(hass, "910GABWD"),
+            codes.atco_to_crs(hass, "910GACTNMLJ"),
+        )
+        assert results == ["ABW", "ABW", "AML"]
+        assert letter_loads == ["A"]
+
+    async def test_failed_letter_retried_after_delay(self, hass, monkeypatch) -> None:
+        loads = []
+
+        async def failing(hass, letter):
+            loads.append(letter)
+            return None
+
+        async def no_tfl(hass, atco):
+            return None
+
+        monkeypatch.setattr(codes, "_load_letter", failing)
+        monkeypatch.setattr(codes, "_tfl_api_crs", no_tfl)
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GABWD")
+        crs_codes = await codes.async_get_crs_codes(hass)
+        assert "A" not in crs_codes._letters
+        crs_codes._crs.clear()
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GABWD")
+        assert loads == ["A"]
+
+        crs_codes._crs.clear()
+        crs_codes._letter_failures["A"] -= codes.LETTER_RETRY
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GABWD")
+        assert loads == ["A", "A"]
+
+    async def test_unknown_code_cached_briefly(
+        self, hass, letter_loads: list, monkeypatch
+    ) -> None:
+        lookups = []
+
+        async def tfl(hass, atco):
+            lookups.append(atco)
+            return None
+
+        monkeypatch.setattr(codes, "_tfl_api_crs", tfl)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await codes.atco_to_crs(hass, "910GAXXX")
+        assert lookups == ["910GAXXX"]
+
+        crs_codes = await codes.async_get_crs_codes(hass)
+        resolved, _ = crs_codes._crs["910GAXXX"]
+        crs_codes._crs["910GAXXX"] = (resolved - codes.NEGATIVE_TTL, None)
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GAXXX")
+        assert len(lookups) == 2
+
+
+class TestPersistence:
+    async def test_stored_codes_need_no_fetch(
+        self, hass, hass_storage, letter_loads: list
+    ) -> None:
+        now = time.time()
+        hass_storage[codes.STORAGE_KEY] = {
+            "version": 1,
+            "key": codes.STORAGE_KEY,
+            "data": {
+                "letters": {"B": {"fetched": now, "codes": {"BDSTHMS": "BDS"}}},
+                "crs": {
+                    "910GACTNMLJ": {"resolved": now, "crs": "AML"},
+                    "910GAXXX": {"resolved": now - codes.CACHE_TTL, "crs": "AXX"},
+                },
+            },
+        }
+        assert await codes.atco_to_crs(hass, "910GACTNMLJ") == "AML"
+        assert await codes.atco_to_crs(hass, "910GBDSTHMS") == "BDS"
+        assert letter_loads == []
+        # Expired entries are dropped on load.
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GAXXX")
+
+    async def test_only_positive_results_saved(
+        self, hass, hass_storage, letter_loads: list
+    ) -> None:
+        await codes.atco_to_crs(hass, "910GABWD")
+        with pytest.raises(ValueError):
+            await codes.atco_to_crs(hass, "910GAXXX")
+        data = (await codes.async_get_crs_codes(hass))._data_to_save()
+        assert data["crs"]["910GABWD"]["crs"] == "ABW"
+        assert "910GAXXX" not in data["crs"]
+        assert data["letters"]["A"]["codes"]["ABWD"] == "ABW"
+
+    async def test_concurrent_first_lookups_wait_for_the_load(
+        self, hass, hass_storage, letter_loads: list, monkeypatch
+    ) -> None:
+        hass_storage[codes.STORAGE_KEY] = {
+            "version": 1,
+            "key": codes.STORAGE_KEY,
+            "data": {
+                "letters": {"Z": {"fetched": time.time(), "codes": {"ZZZZ": "ZZZ"}}}
+            },
+        }
+        original = codes.CrsCodes.async_load
+
+        async def slow_load(self) -> None:
+            await asyncio.sleep(0.01)
+            await original(self)
+
+        monkeypatch.setattr(codes.CrsCodes, "async_load", slow_load)
+        results = await asyncio.gather(
+            codes.atco_to_crs(hass, "910GZZZZ"), codes.atco_to_crs(hass, "9100ZZZZ")
+        )
+        assert results == ["ZZZ", "ZZZ"]
+        assert letter_loads == []
+
+    async def test_kept_per_hass(self, hass) -> None:
+        from custom_components.london_tfl.const import DATA_CRS_CODES
+
+        crs_codes = await codes.async_get_crs_codes(hass)
+        assert await hass.data[DATA_CRS_CODES] is crs_codes
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from homeassistant import config_entries, data_entry_flow
+
+from custom_components.london_tfl import catalogue
+from custom_components.london_tfl.catalogue import async_get_catalogue
+from custom_components.london_tfl.const import DOMAIN
+from custom_components.london_tfl.stop_index import SEARCH_THRESHOLD
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch, enable_custom_integrations):
+    async def no_reply(url, **kwargs):
+        return None
+
+    monkeypatch.setattr(catalogue, "request", no_reply)
+
+
+async def _cache(hass, method: str, line: str, stations: dict) -> None:
+    cat = await async_get_catalogue(hass)
+    cat._entries[f"lines/{method}"] = {
+        "fetched": time.time(),
+        "items": {line: line.title()},
+    }
+    cat._entries[f"stations/{method}/{line}"] = {
+        "fetched": time.time(),
+        "items": stations,
+    }
+
+
+async def _to_station_step(hass, method: str, line: str) -> dict:
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"method": method}
+    )
+    return await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"line": line}
+    )
+
+
+class TestStationSearch:
+    async def test_short_line_skips_search(self, hass) -> None:
+        await _cache(hass, "tube", "jubilee", {"940GZZLUSTD": "Stratford"})
+        result = await _to_station_step(hass, "tube", "jubilee")
+        assert result["type"] == data_entry_flow.FlowResultType.FORM
+        assert result["step_id"] == "station"
+
+    async def test_long_line_searches_first(self, hass) -> None:
+        stations = {
+            f"4900000{i:02d}X": f"Stop {i:02d}" for i in range(SEARCH_THRESHOLD + 1)
+        }
+        stations["490000999K"] = "Stratford Bus Station (Stop K)"
+        await _cache(hass, "bus", "241", stations)
+        result = await _to_station_step(hass, "bus", "241")
+        assert result["step_id"] == "station_search"
+
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {"search": "nowhere"}
+        )
+        assert result["step_id"] == "station_search"
+        assert result["errors"] == {"search": "no_matches"}
+
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {"search": "stratford"}
+        )
+        assert result["step_id"] == "station"
+        station_field = next(k for k in result["data_schema"].schema if k == "station")
+        assert result["data_schema"].schema[station_field].container == {
+            "490000999K": "Stratford Bus Station (Stop K)"
+        }
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.london_tfl.const import DOMAIN
+from custom_components.london_tfl.coordinator import (
+    IMMINENT_INTERVAL,
+    MAX_INTERVAL,
+    NO_SERVICE_INTERVAL,
+    SCAN_INTERVAL,
+    LondonTfLCoordinator,
+    next_poll_interval,
+    stop_key,
+)
+from custom_components.london_tfl.tfl_data import TfLData
+
+NOW = 1_750_000_000.0
+
+
+class TestNextPollInterval:
+    def test_imminent_departure_polls_fast(self) -> None:
+        assert next_poll_interval(NOW, NOW + 120, None, False) == IMMINENT_INTERVAL
+
+    def test_departure_within_twenty_minutes_uses_default(self) -> None:
+        assert next_poll_interval(NOW, NOW + 15 * 60, None, True) == SCAN_INTERVAL
+
+    def test_far_predictions_back_off(self) -> None:
+        assert next_poll_interval(NOW, NOW + 23 * 60, None, True) == timedelta(
+            minutes=3
+        )
+
+    def test_backoff_is_capped(self) -> None:
+        assert next_poll_interval(NOW, NOW + 90 * 60, None, True) == MAX_INTERVAL
+
+    def test_no_predictions_without_timetable_uses_default(self) -> None:
+        assert next_poll_interval(NOW, None, None, False) == SCAN_INTERVAL
+
+    def test_no_service_in_timetable_pauses(self) -> None:
+        assert next_poll_interval(NOW, None, None, True) == NO_SERVICE_INTERVAL
+
+    @pytest.mark.parametrize("minutes,expected", [
+        (10, SCAN_INTERVAL),
+        (40, timedelta(minutes=10)),
+        (300, NO_SERVICE_INTERVAL),
+    ])
+    def test_waits_for_next_scheduled_departure(
+        self, minutes: int, expected: timedelta
+    ) -> None:
+        assert next_poll_interval(NOW, None, NOW + minutes * 60, True) == expected
+
+
+class TestStopKey:
+    def test_platform_filter_is_stripped(self) -> None:
+        assert stop_key("tube", "jubilee", "940GZZLUSTD", " 13 ", 3) == stop_key(
+            "tube", "jubilee", "940GZZLUSTD", "13", "3"
+        )
+
+
+class TestConfigEntry:
+    async def test_entry_kept_outside_setup(self, hass) -> None:
+        entry = MockConfigEntry(domain=DOMAIN)
+        coordinator = LondonTfLCoordinator(
+            hass,
+            TfLData(method="bus", line="241", station="490000000X"),
+            platform_filter="",
+            max_items=3,
+            config_entry=entry,
+        )
+        assert coordinator.config_entry is entry
+        await coordinator.async_shutdown()
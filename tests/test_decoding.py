@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from custom_components.london_tfl import decode
+from custom_components.london_tfl.const import TFL_TRANSPORT_TYPES
+from custom_components.london_tfl.tfl_data import TfLData
+from custom_components.london_tfl.timetable import compile_timetable
+
+FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
+
+
+class TestDecodeArrivals:
+    @pytest.mark.parametrize(
+        "method,line,fixture",
+        [("tube", "jubilee", "underground.json"), ("bus", "241", "bus.json")],
+    )
+    def test_projection_gives_same_departures(
+        self, method: str, line: str, fixture: str
+    ) -> None:
+        text = (FIXTURES / fixture).read_text()
+        full = TfLData(method=method, line=line, station="x")
+        fields = decode.arrival_fields(
+            TFL_TRANSPORT_TYPES[full._method_property(TFL_TRANSPORT_TYPES)]
+        )
+
+        full.populate(json.loads(text), filter_platform="")
+        projected = TfLData(method=method, line=line, station="x")
+        projected.populate(decode.decode_arrivals(text, fields), filter_platform="")
+
+        assert projected._raw_result == full._raw_result
+
+    def test_only_requested_fields_kept(self) -> None:
+        text = '[{"lineName": "241", "vehicleId": "LX1", "towards": "Stratford"}]'
+        assert decode.decode_arrivals(text, ("lineName", "towards")) == [
+            {"lineName": "241", "towards": "Stratford"}
+        ]
+
+    def test_error_object_rejected(self) -> None:
+        with pytest.raises(ValueError):
+            decode.decode_arrivals('{"httpStatusCode": 429}', ("towards",))
+
+    def test_invalid_json_raises_value_error(self) -> None:
+        with pytest.raises(ValueError):
+            decode.decode_arrivals("<html>", ("towards",))
+
+
+class TestDecodeTimetable:
+    def test_projection_compiles_identically(self) -> None:
+        text = (FIXTURES / "timetable_490002290ZZ.json").read_text()
+        for station in ("490002290ZZ", "490002298ZZ"):
+            assert compile_timetable(
+                decode.decode_timetable(text), station
+            ) == compile_timetable(json.loads(text), station)
+
+    def test_list_rejected(self) -> None:
+        with pytest.raises(ValueError):
+            decode.decode_timetable("[]")
+
+
+class TestAsyncDecode:
+    async def test_large_bodies_decoded_in_executor(self, hass, monkeypatch) -> None:
+        jobs = []
+        original = hass.async_add_executor_job
+
+        def track(target, *args):
+            jobs.append(target)
+            return original(target, *args)
+
+        monkeypatch.setattr(hass, "async_add_executor_job", track)
+        monkeypatch.setattr(decode, "EXECUTOR_THRESHOLD", 10)
+        assert await decode.async_decode(hass, "[1]", decode.loads) == [1]
+        assert jobs == []
+        assert await decode.async_decode(hass, "[1, 2, 3, 4, 5]", decode.loads) == [
+            1,
+            2,
+            3,
+            4,
+            5,
+        ]
+        assert jobs == [decode.loads]
@@ -0,0 +1,235 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from custom_components.london_tfl import feeds
+from custom_components.london_tfl.tfl_data import TfLData
+
+FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
+
+
+@pytest.fixture
+def requested(monkeypatch) -> list:
+    requested = []
+    body = (FIXTURES / "bus.json").read_text()
+
+    async def fake_request(url, **kwargs):
+        requested.append(url)
+        await asyncio.sleep(0)
+        return body
+
+    monkeypatch.setattr(feeds, "request", fake_request)
+    return requested
+
+
+def bus(line: str, station: str = "490004222E") -> TfLData:
+    return TfLData(method="bus", line=line, station=station)
+
+
+class TestBusFeed:
+    async def test_routes_at_one_stop_share_a_request(
+        self, hass, requested: list
+    ) -> None:
+        registry = feeds.get_feeds(hass)
+        stops = [bus("241"), bus("129"), bus("330")]
+        for stop in stops:
+            registry.register(stop)
+
+        results = await asyncio.gather(*(stop.fetch(hass) for stop in stops))
+
+        assert len(requested) == 1
+        for stop, result in zip(stops, results):
+            assert result
+            assert {item["lineId"] for item in result} == {stop.line}
+
+    async def test_slices_reused_within_ttl(
+        self, hass, requested: list, monkeypatch
+    ) -> None:
+        registry = feeds.FeedRegistry()
+        stop = bus("241")
+        registry.register(stop)
+        await registry.async_fetch(hass, stop)
+        await registry.async_fetch(hass, stop)
+        assert len(requested) == 1
+        monkeypatch.setattr(feeds, "FEED_TTL", 0.0)
+        await registry.async_fetch(hass, stop)
+        assert len(requested) == 2
+
+    async def test_route_without_predictions_gets_empty_slice(
+        self, hass, requested: list
+    ) -> None:
+        registry = feeds.FeedRegistry()
+        stop = bus("25")
+        registry.register(stop)
+        assert await registry.async_fetch(hass, stop) == []
+
+    async def test_different_stops_get_separate_feeds(
+        self, hass, requested: list
+    ) -> None:
+        registry = feeds.FeedRegistry()
+        first, second = bus("241"), bus("241", station="490004222W")
+        registry.register(first)
+        registry.register(second)
+        await registry.async_fetch(hass, first)
+        await registry.async_fetch(hass, second)
+        assert len(requested) == 2
+
+    async def test_failed_request_returns_error(self, hass, monkeypatch) -> None:
+        async def no_reply(url, **kwargs):
+            return None
+
+        monkeypatch.setattr(feeds, "request", no_reply)
+        registry = feeds.FeedRegistry()
+        stop = bus("241")
+        registry.register(stop)
+        assert await registry.async_fetch(hass, stop) == "Cannot reach TfL"
+
+    async def test_unregistered_stop_has_no_feed(self, hass) -> None:
+        registry = feeds.FeedRegistry()
+        stop = bus("241")
+        registry.register(stop)
+        registry.unregister(stop)
+        assert await registry.async_fetch(hass, stop) is None
+        assert registry._feeds == {}
+
+    def test_other_modes_not_served(self) -> None:
+        registry = feeds.FeedRegistry()
+        registry.register(TfLData(method="tube", line="jubilee", station="940GZZLUSTD"))
+        assert registry._feeds == {}
+
+
+@pytest.fixture
+def station_requests(monkeypatch) -> list:
+    requested = []
+    jubilee = json.loads((FIXTURES / "underground.json").read_text())
+    central = [
+        {**item, "lineId": "central", "platformName": "Westbound - Platform 3"}
+        for item in jubilee[:5]
+    ]
+    body = json.dumps(jubilee + central)
+
+    async def fake_request(url, **kwargs):
+        requested.append(url)
+        await asyncio.sleep(0)
+        return body
+
+    monkeypatch.setattr(feeds, "request", fake_request)
+    return requested
+
+
+def tube(line: str, station: str = "940GZZLUSTD") -> TfLData:
+    return TfLData(method="tube", line=line, station=station)
+
+
+class TestStationFeed:
+    async def test_lines_at_one_station_share_a_request(
+        self, hass, station_requests: list
+    ) -> None:
+        registry = feeds.get_feeds(hass)
+        jubilee, central = tube("jubilee"), tube("central")
+        registry.register(jubilee)
+        registry.register(central)
+
+        results = await asyncio.gather(jubilee.fetch(hass), central.fetch(hass))
+
+        assert station_requests == ["https://api.tfl.gov.uk/StopPoint/940GZZLUSTD/Arrivals?test="]
+        assert len(results[0]) == 36
+        assert len(results[1]) == 5
+
+    async def test_slice_is_filtered_and_sorted_as_before(
+        self, hass, station_requests: list
+    ) -> None:
+        registry = feeds.get_feeds(hass)
+        jubilee, central = tube("jubilee"), tube("central")
+        registry.register(jubilee)
+        registry.register(central)
+
+        jubilee.populate(await jubilee.fetch(hass), "13")
+        jubilee.sort_data(3)
+
+        assert len(jubilee.get_departures()) == 3
+        assert all(d["platform"] == "Westbound - 13" for d in jubilee.get_departures())
+
+    def test_single_line_keeps_its_own_request(self) -> None:
+        registry = feeds.FeedRegistry()
+        registry.register(tube("jubilee"))
+        registry.register(tube("jubilee"))
+        assert registry._feeds == {}
+
+    def test_station_feed_dropped_when_second_line_goes(self) -> None:
+        registry = feeds.FeedRegistry()
+        jubilee, central = tube("jubilee"), tube("central")
+        registry.register(jubilee)
+        registry.register(central)
+        assert list(registry._feeds) == [("station", "940GZZLUSTD", None, False)]
+        registry.unregister(central)
+        assert registry._feeds == {}
+
+    def test_national_rail_not_served(self) -> None:
+        registry = feeds.FeedRegistry()
+        registry.register(
+            TfLData(method="national-rail", line="southern", station="910GLNDNBDE")
+        )
+        registry.register(
+            TfLData(method="national-rail", line="thameslink", station="910GLNDNBDE")
+        )
+        assert registry._feeds == {}
+
+
+STATIONS = ["940GZZLUSTD", "940GZZLUWHM", "940GZZLUCGT", "940GZZLUNGW", "940GZZLUCYF"]
+
+
+@pytest.fixture
+def line_requests(monkeypatch) -> list:
+    requested = []
+    predictions = json.loads((FIXTURES / "underground.json").read_text())
+    body = json.dumps(
+        [
+            {**item, "naptanId": STATIONS[i % len(STATIONS)]}
+            for i, item in enumerate(predictions)
+        ]
+    )
+
+    async def fake_request(url, **kwargs):
+        requested.append(url)
+        await asyncio.sleep(0)
+        return body
+
+    monkeypatch.setattr(feeds, "request", fake_request)
+    return requested
+
+
+class TestLineFeed:
+    async def test_stations_on_one_line_share_a_request(
+        self, hass, line_requests: list
+    ) -> None:
+        registry = feeds.get_feeds(hass)
+        stops = [tube("jubilee", station) for station in STATIONS]
+        for stop in stops:
+            registry.register(stop)
+
+        results = await asyncio.gather(*(stop.fetch(hass) for stop in stops))
+
+        assert line_requests == ["https://api.tfl.gov.uk/Line/jubilee/Arrivals?test="]
+        assert sum(len(result) for result in results) == 36
+        for stop, result in zip(stops, results):
+            assert {item["naptanId"] for item in result} == {stop.station}
+
+    def test_needs_enough_stations(self) -> None:
+        registry = feeds.FeedRegistry()
+        for station in STATIONS[:feeds.LINE_FEED_MIN_STATIONS - 1]:
+            registry.register(tube("jubilee", station))
+        assert registry._feeds == {}
+        registry.register(tube("jubilee", STATIONS[-1]))
+        assert list(registry._feeds) == [("line", "jubilee", None, False)]
+
+    def test_line_fed_lines_do_not_count_for_station_feed(self) -> None:
+        registry = feeds.FeedRegistry()
+        for station in STATIONS[:feeds.LINE_FEED_MIN_STATIONS]:
+            registry.register(tube("jubilee", station))
+        central = tube("central", STATIONS[0])
+        registry.register(central)
+        assert list(registry._feeds) == [("line", "jubilee", None, False)]
+        assert registry._assigned.get(central) is None
@@ -0,0 +1,102 @@
+import asyncio
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import pytest
+from homeassistant.config_entries import ConfigEntryState
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.london_tfl import tfl_data
+from custom_components.london_tfl.const import DATA_FEEDS, DOMAIN
+
+FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
+
+
+@pytest.fixture
+def requested(monkeypatch, enable_custom_integrations) -> list:
+    requested = []
+    # Move the recorded predictions into the future so they count as departures.
+    arrivals = json.loads((FIXTURES / "underground.json").read_text())
+    soon = datetime.now(UTC) + timedelta(minutes=2)
+    for i, item in enumerate(arrivals):
+        item["expectedArrival"] = (soon + timedelta(minutes=i)).isoformat()
+    timetable = (FIXTURES / "timetable_490002290ZZ.json").read_text()
+
+    async def fake_request(url, **kwargs):
+        requested.append(url)
+        return timetable if "/Timetable/" in url else json.dumps(arrivals)
+
+    monkeypatch.setattr(tfl_data, "request", fake_request)
+    return requested
+
+
+@pytest.fixture
+def entry(hass) -> MockConfigEntry:
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="Stratford",
+        data={
+            "stops": [
+                {
+                    "line": "jubilee",
+                    "method": "tube",
+                    "station": "940GZZLUSTD",
+                    "max": 3,
+                    "platform": "",
+                    "shortenStationNames": False,
+                }
+            ]
+        },
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+class TestConfigEntrySetup:
+    async def test_entry_creates_sensors(
+        self, hass, entry: MockConfigEntry, requested: list
+    ) -> None:
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        assert entry.state is ConfigEntryState.LOADED
+        states = hass.states.async_all("sensor")
+        # One sensor per departure mode of the stop.
+        assert len(states) == 3
+        assert any(len(state.attributes.get("departures", [])) == 3 for state in states)
+        assert any("/line/jubilee/arrivals/940GZZLUSTD" in url for url in requested)
+
+    async def test_coordinator_update_and_unload(
+        self, hass, entry: MockConfigEntry, requested: list
+    ) -> None:
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        platform = hass.data["entity_components"]["sensor"]
+        sensor = next(iter(platform.entities))
+        assert sensor.coordinator.config_entry is entry
+        data = await sensor.coordinator._async_update_data()
+        assert data["error"] is None
+        assert len(data["departures"]["realtime"]) == 3
+
+        assert await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+        assert entry.state is ConfigEntryState.NOT_LOADED
+        assert not hass.data[DATA_FEEDS]._stops
+
+    async def test_setup_does_not_wait_for_first_refresh(
+        self, hass, entry: MockConfigEntry, requested: list, monkeypatch
+    ) -> None:
+        release = asyncio.Event()
+
+        async def slow_request(url, **kwargs):
+            await release.wait()
+            return "[]"
+
+        monkeypatch.setattr(tfl_data, "request", slow_request)
+        async with asyncio.timeout(5):
+            assert await hass.config_entries.async_setup(entry.entry_id)
+        assert len(hass.states.async_all("sensor")) == 3
+        release.set()
+        await hass.async_block_till_done()
@@ -0,0 +1,107 @@
+import pytest
+
+from custom_components.london_tfl.ldbws_soap import (
+    DepartureBoardParser,
+    SoapFault,
+    UnexpectedResponse,
+    departure_board_envelope,
+)
+
+BOARD = b"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+<soap:Body>
+<GetDepartureBoardResponse xmlns="http://thalesgroup.com/RTTI/2021-11-01/ldb/">
+<GetStationBoardResult xmlns:lt4="http://thalesgroup.com/RTTI/2015-11-27/ldb/types"
+  xmlns:lt5="http://thalesgroup.com/RTTI/2016-02-16/ldb/types"
+  xmlns:lt8="http://thalesgroup.com/RTTI/2021-11-01/ldb/types">
+<lt4:generatedAt>2025-07-28T12:00:00+01:00</lt4:generatedAt>
+<lt4:locationName>London Bridge</lt4:locationName>
+<lt4:crs>LBG</lt4:crs>
+<lt8:trainServices>
+<lt8:service>
+<lt4:std>12:04</lt4:std><lt4:etd>On time</lt4:etd>
+<lt4:platform>5</lt4:platform>
+<lt4:operator>Southern</lt4:operator><lt4:operatorCode>SN</lt4:operatorCode>
+<lt5:origin>
+<lt4:location><lt4:locationName>London Bridge</lt4:locationName></lt4:location>
+</lt5:origin>
+<lt5:destination>
+<lt4:location>
+<lt4:locationName>East Grinstead</lt4:locationName><lt4:crs>EGR</lt4:crs>
+</lt4:location>
+<lt4:location><lt4:locationName>Uckfield</lt4:locationName><lt4:crs>UCK</lt4:crs></lt4:location>
+</lt5:destination>
+</lt8:service>
+<lt8:service>
+<lt4:std>12:07</lt4:std><lt4:etd>12:09</lt4:etd>
+<lt4:operator>Thameslink</lt4:operator><lt4:operatorCode>TL</lt4:operatorCode>
+<lt5:destination><lt4:location><lt4:locationName>Brighton</lt4:locationName></lt4:location></lt5:destination>
+</lt8:service>
+<lt8:service>
+<lt4:std>12:10</lt4:std><lt4:operator>Southeastern</lt4:operator><lt4:operatorCode>SE</lt4:operatorCode>
+</lt8:service>
+</lt8:trainServices>
+</GetStationBoardResult>
+</GetDepartureBoardResponse>
+</soap:Body>
+</soap:Envelope>"""
+
+FAULT = b"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>
+<soap:Fault><faultcode>soap:Client</faultcode>
+<faultstring>Invalid crs code supplied</faultstring></soap:Fault>
+</soap:Body></soap:Envelope>"""
+
+
+def parse(body: bytes, chunk: int = 64):
+    parser = DepartureBoardParser()
+    for i in range(0, len(body), chunk):
+        parser.feed(body[i:i + chunk])
+    return parser.close()
+
+
+class TestDepartureBoardParser:
+    def test_services_with_destination(self) -> None:
+        location_name, services = parse(BOARD)
+        assert location_name == "London Bridge"
+        assert services == [
+            {
+                "std": "12:04",
+                "platform": "5",
+                "operator": "Southern",
+                "operatorCode": "SN",
+                "destination": "East Grinstead",
+            },
+            {
+                "std": "12:07",
+                "operator": "Thameslink",
+                "operatorCode": "TL",
+                "destination": "Brighton",
+            },
+        ]
+
+    def test_chunk_boundaries_do_not_matter(self) -> None:
+        assert parse(BOARD, chunk=1) == parse(BOARD, chunk=len(BOARD))
+
+    def test_empty_board(self) -> None:
+        body = (
+            BOARD.split(b"<lt8:trainServices>")[0]
+            + b"</GetStationBoardResult></GetDepartureBoardResponse>"
+            + b"</soap:Body></soap:Envelope>"
+        )
+        assert parse(body) == ("London Bridge", [])
+
+    def test_fault(self) -> None:
+        with pytest.raises(SoapFault, match="Invalid crs"):
+            parse(FAULT)
+
+    def test_unexpected_document(self) -> None:
+        with pytest.raises(UnexpectedResponse):
+            parse(b"<html><body>Unauthorized</body></html>")
+
+
+class TestEnvelope:
+    def test_values_escaped(self) -> None:
+        body = departure_board_envelope("a<b", "LBG", 20).decode()
+        assert "<typ:TokenValue>a&lt;b</typ:TokenValue>" in body
+        assert "<ldb:numRows>20</ldb:numRows><ldb:crs>LBG</ldb:crs>" in body
@@ -0,0 +1,475 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from custom_components.london_tfl import network
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    network._requests.clear()
+    yield
+    network._requests.clear()
+
+
+@pytest.fixture
+def calls(monkeypatch) -> list:
+    calls = []
+
+    async def fake_request(url, *args):
+        calls.append(url)
+        await asyncio.sleep(0)
+        return "[]"
+
+    monkeypatch.setattr(network, "_request", fake_request)
+    return calls
+
+
+class TestRequestCoalescing:
+    async def test_concurrent_identical_keys_share_one_request(
+        self, calls: list
+    ) -> None:
+        results = await asyncio.gather(
+            network.request("https://example/a?test=1", key="https://example/a"),
+            network.request("https://example/a?test=2", key="https://example/a"),
+        )
+        assert results == ["[]", "[]"]
+        assert len(calls) == 1
+
+    async def test_response_reused_within_ttl(self, calls: list) -> None:
+        await network.request("https://example/a")
+        await network.request("https://example/a")
+        assert len(calls) == 1
+
+    async def test_response_expires_after_ttl(self, calls: list, monkeypatch) -> None:
+        await network.request("https://example/a")
+        monkeypatch.setattr(network, "COALESCE_TTL", 0.0)
+        await network.request("https://example/a")
+        assert len(calls) == 2
+
+    async def test_different_keys_not_coalesced(self, calls: list) -> None:
+        await asyncio.gather(
+            network.request("https://example/a"),
+            network.request("https://example/b"),
+        )
+        assert len(calls) == 2
+
+    async def test_failed_response_not_reused(self, monkeypatch) -> None:
+        calls = []
+
+        async def failing_request(url, *args):
+            calls.append(url)
+            return None
+
+        monkeypatch.setattr(network, "_request", failing_request)
+        assert await network.request("https://example/a") is None
+        assert await network.request("https://example/a") is None
+        assert len(calls) == 2
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: str, headers: dict) -> None:
+        self.status = status
+        self._body = body
+        self.headers = headers
+
+    async def text(self) -> str:
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        return None
+
+
+class FakeSession:
+    def __init__(self, responses: list) -> None:
+        self.responses = responses
+        self.sent_headers: list[dict] = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.sent_headers.append(headers or {})
+        return self.responses.pop(0)
+
+
+class TestFreshnessLifetime:
+    def test_max_age(self) -> None:
+        assert network.freshness_lifetime({"Cache-Control": "public, max-age=30"}) == 30
+
+    def test_age_is_subtracted(self) -> None:
+        headers = {"Cache-Control": "max-age=30", "Age": "12"}
+        assert network.freshness_lifetime(headers) == 18
+
+    def test_no_store_is_not_cacheable(self) -> None:
+        assert network.freshness_lifetime({"Cache-Control": "no-store"}) is None
+
+    def test_no_cache_must_revalidate(self) -> None:
+        assert (
+            network.freshness_lifetime({"Cache-Control": "no-cache, max-age=60"}) == 0
+        )
+
+    def test_missing_header_is_stale(self) -> None:
+        assert network.freshness_lifetime({}) == 0
+
+
+class TestResponseCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        network._response_cache.clear()
+        yield
+        network._response_cache.clear()
+
+    async def test_fresh_response_served_without_request(self) -> None:
+        session = FakeSession(
+            [FakeResponse(200, "[1]", {"Cache-Control": "max-age=60"})]
+        )
+        assert await network.fetch(session, "https://example/a", "a") == "[1]"
+        assert await network.fetch(session, "https://example/a", "a") == "[1]"
+        assert len(session.sent_headers) == 1
+
+    async def test_stale_response_revalidated_with_validators(self) -> None:
+        session = FakeSession(
+            [
+                FakeResponse(
+                    200,
+                    "[1]",
+                    {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"},
+                ),
+                FakeResponse(304, "", {"Cache-Control": "max-age=60"}),
+            ]
+        )
+        await network.fetch(session, "https://example/a", "a")
+        assert await network.fetch(session, "https://example/a", "a") == "[1]"
+        assert session.sent_headers[1]["If-None-Match"] == '"v1"'
+        assert (
+            session.sent_headers[1]["If-Modified-Since"]
+            == "Mon, 01 Jan 2024 00:00:00 GMT"
+        )
+        assert network._response_cache["a"].is_fresh()
+
+    async def test_without_cache_key_always_requests(self) -> None:
+        session = FakeSession([
+            FakeResponse(200, "[1]", {"Cache-Control": "max-age=60"}),
+            FakeResponse(200, "[2]", {"Cache-Control": "max-age=60"}),
+        ])
+        assert await network.fetch(session, "https://example/a") == "[1]"
+        assert await network.fetch(session, "https://example/a") == "[2]"
+
+    async def test_error_status_not_cached(self) -> None:
+        session = FakeSession(
+            [FakeResponse(500, "oops", {"Cache-Control": "max-age=60"})]
+        )
+        await network.fetch(session, "https://example/a", "a")
+        assert "a" not in network._response_cache
+
+    async def test_large_body_not_cached(self, monkeypatch) -> None:
+        monkeypatch.setattr(network, "CACHE_MAX_BODY", 4)
+        session = FakeSession([FakeResponse(200, "[1, 2]", {"ETag": '"v1"'})])
+        await network.fetch(session, "https://example/a", "a")
+        assert "a" not in network._response_cache
+
+    async def test_oldest_evicted_over_byte_limit(self, monkeypatch) -> None:
+        monkeypatch.setattr(network, "CACHE_MAX_BYTES", 8)
+        session = FakeSession(
+            [FakeResponse(200, "[1, 2]", {"ETag": '"v1"'}) for _ in range(3)]
+        )
+        for key in ("a", "b", "c"):
+            await network.fetch(session, f"https://example/{key}", key)
+        assert list(network._response_cache) == ["c"]
+
+    async def test_too_many_requests_backs_off(self) -> None:
+        from custom_components.london_tfl.ratelimit import RateLimiter
+
+        limiter = RateLimiter("test", rate_per_minute=6000)
+        session = FakeSession([FakeResponse(429, "slow down", {"Retry-After": "20"})])
+        assert await network.fetch(session, "https://example/a", "a", limiter) is None
+        assert limiter.usage()["throttled_responses"] == 1
+        assert limiter.usage()["blocked_for"] > 0
+
+
+class TestWithAppKey:
+    def test_appends_to_existing_query(self) -> None:
+        assert network.with_app_key("https://x/a?test=", "k") == "https://x/a?test=&app_key=k"
+
+    def test_starts_query(self) -> None:
+        assert network.with_app_key("https://x/a", "k") == "https://x/a?app_key=k"
+
+    def test_no_key_leaves_url(self) -> None:
+        assert network.with_app_key("https://x/a", None) == "https://x/a"
+
+    def test_key_redacted(self) -> None:
+        url = network.with_app_key("https://x/a?test=", "secret")
+        assert network.redact_app_key(url) == "https://x/a?test=&app_key=<redacted>"
+
+    async def test_key_not_logged_on_failure(self, caplog) -> None:
+        class FailingSession:
+            def get(self, url, headers=None):
+                raise aiohttp.InvalidURL(url)
+
+        url = network.with_app_key("https://x/a", "secret")
+        assert await network.fetch(FailingSession(), url) is None
+        assert "app_key=<redacted>" in caplog.text
+        assert "secret" not in caplog.text
+
+
+@pytest.fixture
+def config_dir(hass, tmp_path):
+    # Keep the on-disk WSDL cache out of the shared testing config directory.
+    hass.config.config_dir = str(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.usefixtures("config_dir")
+class TestLDBWSPool:
+    @pytest.fixture
+    def built(self, monkeypatch) -> list:
+        built = []
+
+        class FakeLDBWS:
+            def __init__(self, hass, *, token: str, session=None) -> None:
+                self.token = token
+                self.closed = False
+                built.append(self)
+
+            async def async_close(self) -> None:
+                self.closed = True
+
+        monkeypatch.setattr(network, "LDBWS", FakeLDBWS)
+        yield built
+        network._ldbws_pool.clear()
+        network._ldbws_locks.clear()
+
+    async def test_concurrent_acquires_build_one_client(
+        self, hass, built: list
+    ) -> None:
+        first, second = await asyncio.gather(
+            network.async_acquire_ldbws(hass, "token"),
+            network.async_acquire_ldbws(hass, "token"),
+        )
+        assert first is second
+        assert len(built) == 1
+
+    async def test_tokens_get_separate_clients(self, hass, built: list) -> None:
+        await network.async_acquire_ldbws(hass, "a")
+        await network.async_acquire_ldbws(hass, "b")
+        assert [c.token for c in built] == ["a", "b"]
+
+    async def test_closed_with_last_release(self, hass, built: list) -> None:
+        await network.async_acquire_ldbws(hass, "token")
+        await network.async_acquire_ldbws(hass, "token")
+        await network.async_release_ldbws("token")
+        assert not built[0].closed
+        await network.async_release_ldbws("token")
+        assert built[0].closed
+        assert "token" not in network._ldbws_pool
+
+    async def test_lock_kept_after_last_release(self, hass, built: list) -> None:
+        await network.async_acquire_ldbws(hass, "token")
+        lock = network._ldbws_locks["token"]
+        await network.async_release_ldbws("token")
+        assert network._ldbws_locks["token"] is lock
+        await network.async_acquire_ldbws(hass, "token")
+        assert network._ldbws_locks["token"] is lock
+        assert len(built) == 2
+
+
+@pytest.mark.usefixtures("config_dir")
+class TestWsdlCache:
+    async def test_refresh_keeps_downloaded_documents(self, hass, monkeypatch) -> None:
+        class FakeLDBWS:
+            def __init__(self, *, token: str, cache) -> None:
+                self.cache = cache
+                cache.add(network.LDBWS_WSDL_URL, b"<wsdl/>")
+
+            async def async_close(self) -> None:
+                return None
+
+        monkeypatch.setattr(network, "_ZeepLDBWS", FakeLDBWS)
+        await network.async_refresh_ldbws_wsdl(hass)
+        cache = await hass.async_add_executor_job(network._wsdl_cache, hass)
+        assert (
+            await hass.async_add_executor_job(cache.get, network.LDBWS_WSDL_URL)
+            == b"<wsdl/>"
+        )
+
+    async def test_failed_refresh_leaves_cache(self, hass, monkeypatch) -> None:
+        cache = await hass.async_add_executor_job(network._wsdl_cache, hass)
+        await hass.async_add_executor_job(cache.add, network.LDBWS_WSDL_URL, b"<old/>")
+
+        def broken(*, token: str, cache) -> None:
+            cache.add(network.LDBWS_WSDL_URL, b"<partial/>")
+            raise OSError("unreachable")
+
+        monkeypatch.setattr(network, "_ZeepLDBWS", broken)
+        with pytest.raises(OSError):
+            await network.async_refresh_ldbws_wsdl(hass)
+        assert (
+            await hass.async_add_executor_job(cache.get, network.LDBWS_WSDL_URL)
+            == b"<old/>"
+        )
+
+
+class TestSharedDepartureBoard:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        # Skip __init__, which downloads the WSDL.
+        client = object.__new__(network.LDBWS)
+        client._LDBWS__board_rows = {}
+        client._LDBWS__boards = network.SingleFlight()
+        client.requested = []
+
+        async def get_departures(crs, *, n):
+            client.requested.append((crs, n))
+            await asyncio.sleep(0)
+            return [crs]
+
+        monkeypatch.setattr(client, "get_departures", get_departures)
+        return client
+
+    async def test_one_request_for_all_subscribers(self, client) -> None:
+        client.subscribe("LBG")
+        client.subscribe("LBG")
+        results = await asyncio.gather(client.get_board("LBG"), client.get_board("LBG"))
+        assert results == [["LBG"], ["LBG"]]
+        assert client.requested == [("LBG", 20)]
+
+    async def test_board_reused_within_ttl(self, client, monkeypatch) -> None:
+        await client.get_board("LBG")
+        await client.get_board("LBG")
+        assert len(client.requested) == 1
+        monkeypatch.setattr(network, "BOARD_TTL", 0.0)
+        await client.get_board("LBG")
+        assert len(client.requested) == 2
+
+    async def test_rows_capped(self, client) -> None:
+        client.subscribe("LBG", 100)
+        client.subscribe("LBG", 100)
+        await client.get_board("LBG")
+        assert client.requested == [("LBG", network.MAX_BOARD_ROWS)]
+
+    async def test_unsubscribe_shrinks_board(self, client) -> None:
+        client.subscribe("LBG")
+        client.subscribe("LBG", 30)
+        client.unsubscribe("LBG", 30)
+        await client.get_board("LBG")
+        assert client.requested == [("LBG", 10)]
+
+
+class FakeStream:
+    def __init__(self, body: bytes) -> None:
+        self._body = body
+
+    async def iter_chunked(self, size: int):
+        for i in range(0, len(self._body), size):
+            yield self._body[i:i + size]
+
+
+class FakePostSession:
+    def __init__(
+        self, body: bytes, status: int = 200, error: Exception | None = None
+    ) -> None:
+        self.body = body
+        self.status = status
+        self.error = error
+        self.posts = 0
+        self.closed = False
+
+    def post(self, url, data=None, headers=None):
+        self.posts += 1
+        if self.error is not None:
+            raise self.error
+        response = FakeResponse(self.status, "", {})
+        response.content = FakeStream(self.body)
+        return response
+
+
+# Well-formed XML, but not a board the fast path knows.
+UNKNOWN_BOARD = b"<Envelope><Body><SomethingNew/></Body></Envelope>"
+
+
+class TestLDBWSFastPath:
+    async def test_board_parsed_without_zeep(self, hass, monkeypatch) -> None:
+        from tests.test_ldbws_soap import BOARD
+
+        def no_zeep(*args):
+            raise AssertionError("zeep should not be needed")
+
+        monkeypatch.setattr(network, "_build_zeep_ldbws", no_zeep)
+        client = network.LDBWS(hass, token="t", session=FakePostSession(BOARD))
+        departures = await client.get_departures("LBG")
+        assert [d.operator_id for d in departures] == ["southern", "thameslink"]
+        assert departures[1].platform == "?"
+        assert departures[0].location_name == "London Bridge"
+
+    async def test_closed_session_replaced(self, hass, monkeypatch) -> None:
+        from tests.test_ldbws_soap import BOARD
+
+        closed, replacement = FakePostSession(BOARD), FakePostSession(BOARD)
+        closed.closed = True
+        monkeypatch.setattr(network, "get_session", lambda hass: replacement)
+        client = network.LDBWS(hass, token="t", session=closed)
+        assert len(await client.get_departures("LBG")) == 2
+        assert (closed.posts, replacement.posts) == (0, 1)
+
+    @pytest.fixture
+    def zeep_calls(self, monkeypatch) -> list:
+        calls = []
+
+        class FakeZeep:
+            async def get_departures(self, crs, *, n):
+                calls.append(crs)
+                return ["from zeep"]
+
+        monkeypatch.setattr(
+            network, "_build_zeep_ldbws", lambda hass, token: FakeZeep()
+        )
+        return calls
+
+    @pytest.mark.parametrize("session", [
+        FakePostSession(b"<html>Bad Gateway</html>", status=502),
+        FakePostSession(b"<html>Internal Server Error</html>", status=500),
+        FakePostSession(b"", error=aiohttp.ClientConnectionError()),
+        FakePostSession(b"", error=TimeoutError()),
+    ])
+    async def test_transient_errors_raised_without_zeep(
+        self, hass, zeep_calls: list, session: FakePostSession
+    ) -> None:
+        client = network.LDBWS(hass, token="t", session=session)
+        for _ in range(2):
+            with pytest.raises(network.LDBWSError):
+                await client.get_departures("LBG")
+        # The fast path is kept for the next poll.
+        assert session.posts == 2
+        assert zeep_calls == []
+
+    async def test_soap_fault_raised(self, hass, zeep_calls: list) -> None:
+        from tests.test_ldbws_soap import FAULT
+
+        client = network.LDBWS(
+            hass, token="t", session=FakePostSession(FAULT, status=500)
+        )
+        with pytest.raises(network.LDBWSError):
+            await client.get_departures("LBG")
+        assert zeep_calls == []
+
+    async def test_unknown_schema_falls_back_to_zeep_for_a_while(
+        self, hass, zeep_calls: list
+    ) -> None:
+        session = FakePostSession(UNKNOWN_BOARD)
+        client = network.LDBWS(hass, token="t", session=session)
+        assert await client.get_departures("LBG") == ["from zeep"]
+        assert await client.get_departures("LBG") == ["from zeep"]
+        assert session.posts == 1
+
+    async def test_fast_path_retried_after_fallback(
+        self, hass, zeep_calls: list, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(network, "FAST_PATH_RETRY", 0.0)
+        session = FakePostSession(UNKNOWN_BOARD)
+        client = network.LDBWS(hass, token="t", session=session)
+        await client.get_departures("LBG")
+        await client.get_departures("LBG")
+        assert session.posts == 2
+        assert len(zeep_calls) == 2
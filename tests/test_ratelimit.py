@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from custom_components.london_tfl.ratelimit import (
+    PRIORITY_CATALOGUE,
+    PRIORITY_REALTIME,
+    PRIORITY_TIMETABLE,
+    RateLimiter,
+    parse_retry_after,
+    tfl_limiter,
+)
+
+
+class TestRateLimiter:
+    async def test_burst_passes_immediately(self) -> None:
+        limiter = RateLimiter("test", rate_per_minute=60, burst=3)
+        for _ in range(3):
+            await asyncio.wait_for(limiter.acquire(), 0.1)
+        assert limiter.usage()["requests_last_minute"] == 3
+
+    async def test_queued_requests_served_by_priority(self) -> None:
+        limiter = RateLimiter("test", rate_per_minute=6000, burst=1)
+        await limiter.acquire()
+        order = []
+
+        async def take(priority: int, label: str) -> None:
+            await limiter.acquire(priority)
+            order.append(label)
+
+        await asyncio.gather(
+            take(PRIORITY_CATALOGUE, "catalogue"),
+            take(PRIORITY_TIMETABLE, "timetable"),
+            take(PRIORITY_REALTIME, "realtime"),
+        )
+        assert order == ["realtime", "timetable", "catalogue"]
+
+    async def test_backoff_blocks_requests(self) -> None:
+        limiter = RateLimiter("test", rate_per_minute=6000, burst=5)
+        limiter.backoff(30)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(), 0.05)
+        usage = limiter.usage()
+        assert usage["throttled_responses"] == 1
+        assert usage["blocked_for"] > 0
+
+
+class TestHelpers:
+    def test_parse_retry_after(self) -> None:
+        assert parse_retry_after("12") == 12
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+    def test_app_key_gets_its_own_bucket(self) -> None:
+        assert tfl_limiter("abcd1234") is not tfl_limiter(None)
+        assert tfl_limiter("abcd1234") is tfl_limiter("abcd1234")
+        assert "abcd1234" not in tfl_limiter("abcd1234").name
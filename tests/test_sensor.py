@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from custom_components.london_tfl.sensor import (
+    MAX_ATTRIBUTE_DEPARTURES,
+    LondonTfLSensor,
+)
+from custom_components.london_tfl.tfl_data import TfLData
+
+FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
+
+
+class FakeCoordinator:
+    """Just what LondonTfLSensor reads from its coordinator."""
+
+    def __init__(self, tfl_data: TfLData) -> None:
+        self.tfl_data = tfl_data
+        self.filter_platform = ""
+        self.max_items = 5
+        self.data = None
+        self.last_update_success = True
+
+    def publish(self, departures: list) -> None:
+        self.data = {"error": None, "departures": {"realtime": departures}}
+
+
+@pytest.fixture
+def coordinator() -> FakeCoordinator:
+    tfl = TfLData(method="tube", line="jubilee", station="940GZZLUSTD")
+    tfl.populate(
+        json.loads((FIXTURES / "underground.json").read_text()), filter_platform=""
+    )
+    tfl.sort_data(5)
+    coordinator = FakeCoordinator(tfl)
+    coordinator.publish(tfl.get_departures("realtime"))
+    return coordinator
+
+
+def _sensor(coordinator, **kwargs) -> LondonTfLSensor:
+    sensor = LondonTfLSensor(coordinator, "London TfL", False, **kwargs)
+    sensor._update_from_coordinator()
+    return sensor
+
+
+class TestAttributes:
+    def test_built_once_per_update(self, coordinator) -> None:
+        sensor = _sensor(coordinator)
+        first = sensor.extra_state_attributes
+        assert sensor.extra_state_attributes is first
+        assert first["departures"] and first["data"]
+
+        coordinator.publish(coordinator.data["departures"]["realtime"][:1])
+        sensor._update_from_coordinator()
+        assert sensor.extra_state_attributes is not first
+        assert len(sensor.extra_state_attributes["departures"]) == 1
+
+    @pytest.mark.parametrize(
+        "formats,present,absent",
+        [
+            (["hasl"], "departures", "data"),
+            (["upcoming_media"], "data", "departures"),
+        ],
+    )
+    def test_selected_formats_only(self, coordinator, formats, present, absent) -> None:
+        attributes = _sensor(
+            coordinator, attribute_formats=formats
+        ).extra_state_attributes
+        assert present in attributes
+        assert absent not in attributes
+        assert attributes["destination"]
+
+    def test_lists_bounded(self, coordinator) -> None:
+        departures = coordinator.data["departures"]["realtime"]
+        coordinator.publish(
+            departures * (MAX_ATTRIBUTE_DEPARTURES // len(departures) + 2)
+        )
+        attributes = _sensor(coordinator).extra_state_attributes
+        assert len(attributes["departures"]) == MAX_ATTRIBUTE_DEPARTURES
+        # Plus the upcoming-media header entry.
+        assert len(attributes["data"]) == MAX_ATTRIBUTE_DEPARTURES + 1
+
+    def test_bulky_attributes_unrecorded(self) -> None:
+        assert {"departures", "data"} <= LondonTfLSensor._unrecorded_attributes
+
+    def test_error_keeps_last_attributes(self, coordinator) -> None:
+        sensor = _sensor(coordinator)
+        before = sensor.extra_state_attributes
+        coordinator.data = {"error": "Cannot reach TfL", "departures": {}}
+        sensor._update_from_coordinator()
+        assert sensor.state == "Cannot reach TfL"
+        assert sensor.extra_state_attributes is before
+
+
+class TestChangeDetection:
+    @pytest.fixture
+    def writes(self, coordinator, monkeypatch) -> tuple[LondonTfLSensor, list]:
+        sensor = _sensor(coordinator)
+        writes = []
+        monkeypatch.setattr(
+            sensor, "async_write_ha_state", lambda: writes.append(sensor.state)
+        )
+        return sensor, writes
+
+    def test_identical_departures_not_written(self, coordinator, writes) -> None:
+        sensor, written = writes
+        departures = coordinator.data["departures"]["realtime"]
+        # A later poll with the same predictions: new dicts, same content.
+        coordinator.publish([dict(d) for d in departures])
+        sensor._handle_coordinator_update()
+        assert written == []
+
+    def test_changed_prediction_written(self, coordinator, writes) -> None:
+        sensor, written = writes
+        departures = [dict(d) for d in coordinator.data["departures"]["realtime"]]
+        departures[0]["platform"] = "Platform 99"
+        coordinator.publish(departures)
+        sensor._handle_coordinator_update()
+        assert len(written) == 1
+
+    def test_error_written_once(self, coordinator, writes) -> None:
+        sensor, written = writes
+        coordinator.data = {"error": "Cannot reach TfL", "departures": {}}
+        sensor._handle_coordinator_update()
+        sensor._handle_coordinator_update()
+        assert written == ["Cannot reach TfL"]
+
+    def test_availability_change_written(self, coordinator, writes) -> None:
+        sensor, written = writes
+        coordinator.last_update_success = False
+        sensor._handle_coordinator_update()
+        assert len(written) == 1
+
+    def test_departures_carry_no_countdown(self, coordinator) -> None:
+        for departure in coordinator.data["departures"]["realtime"]:
+            assert "time" not in departure and "time_to_station" not in departure
+
+
+class TestNoStaleAttributes:
+    def test_time_dependent_values_not_published(self, coordinator) -> None:
+        # These would freeze while the departures, and so the state, stay the same.
+        attributes = _sensor(coordinator).extra_state_attributes
+        assert "next_departure_minutes" not in attributes
+        assert "last_refresh" not in attributes
+        assert attributes["next_departure_time"]
@@ -0,0 +1,69 @@
+import pytest
+
+from custom_components.london_tfl.stop_index import StopIndex, normalise
+
+
+@pytest.fixture
+def index() -> StopIndex:
+    index = StopIndex()
+    index.add(
+        "bus",
+        "241",
+        {
+            "490000001A": "Stratford Bus Station (Stop A)",
+            "490000002K": "Stratford High Street (Stop K)",
+            "490000003B": "Abbey Road (Stop B)",
+            "490000004C": "Canning Town (Stop C)",
+        },
+    )
+    index.add(
+        "tube",
+        "jubilee",
+        {
+            "940GZZLUSTD": "Stratford Underground Station",
+            "940GZZLUCYF": "Canary Wharf Underground Station",
+        },
+    )
+    return index
+
+
+class TestNormalise:
+    def test_punctuation_and_case(self) -> None:
+        assert normalise("  King's Cross/St. Pancras ") == "king s cross st pancras"
+
+
+class TestStopIndex:
+    def test_prefix_before_word_match(self, index: StopIndex) -> None:
+        assert list(index.search("stratford", method="bus")) == [
+            "490000001A",
+            "490000002K",
+        ]
+
+    def test_word_prefix(self, index: StopIndex) -> None:
+        assert list(index.search("high st")) == ["490000002K"]
+
+    def test_indicator(self, index: StopIndex) -> None:
+        assert list(index.search("stop k")) == ["490000002K"]
+
+    def test_naptan_id(self, index: StopIndex) -> None:
+        assert list(index.search("940gzzlucyf")) == ["940GZZLUCYF"]
+
+    def test_fuzzy_spelling(self, index: StopIndex) -> None:
+        assert "490000004C" in index.search("cannig town")
+
+    def test_across_modes(self, index: StopIndex) -> None:
+        assert set(index.search("stratford")) == {
+            "490000001A",
+            "490000002K",
+            "940GZZLUSTD",
+        }
+
+    def test_restricted_to_line(self, index: StopIndex) -> None:
+        assert list(index.search("stratford", line="jubilee")) == ["940GZZLUSTD"]
+
+    def test_limit(self, index: StopIndex) -> None:
+        assert len(index.search("stratford", limit=1)) == 1
+
+    def test_no_match(self, index: StopIndex) -> None:
+        assert index.search("zzzz") == {}
+        assert index.search("  ") == {}
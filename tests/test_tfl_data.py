@@ -1,11 +1,11 @@
 import json
 import re
-from datetime import datetime, UTC, timedelta
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
 
 import pytest
 
-from custom_components.london_tfl.tfl_data import TfLData
+from custom_components.london_tfl.tfl_data import Arrival, TfLData, parse_timestamp
 
 FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
 
@@ -161,6 +161,55 @@ class TestTfLDataSortAndFilter:
             assert not dep["platform"].startswith("Platform ")
 
 
+class TestArrivalRecords:
+    def test_populate_stores_compact_records(self, raw_underground: list) -> None:
+        tfl = TfLData(
+            method="tube", line="jubilee", station="Stratford Underground Station"
+        )
+        tfl.populate(raw_underground, filter_platform="")
+        assert all(isinstance(item, Arrival) for item in tfl._raw_result)
+        first = tfl._raw_result[0]
+        assert first.arrival == parse_timestamp(raw_underground[0]["expectedArrival"])
+        assert first.station_name == "Stratford Underground Station"
+        assert not hasattr(first, "__dict__")
+
+    def test_prediction_without_arrival_time_is_skipped(self) -> None:
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        entry = _make_realtime_entry(5)
+        broken = dict(entry, expectedArrival="")
+        tfl.populate([entry, broken], filter_platform="")
+        assert len(tfl._raw_result) == 1
+
+    def test_is_data_stale_uses_parsed_times(self) -> None:
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        tfl.populate(
+            [_make_realtime_entry(5), _make_realtime_entry(-5)], filter_platform=""
+        )
+        assert not tfl.is_data_stale(1)
+        assert len(tfl._raw_result) == 1
+        assert tfl.is_data_stale(2)
+
+
+class TestParseTimestamp:
+    def test_zulu_time(self) -> None:
+        assert (
+            parse_timestamp("2025-07-27T16:30:13Z")
+            == datetime(2025, 7, 27, 16, 30, 13, tzinfo=UTC).timestamp()
+        )
+
+    def test_offset_time(self) -> None:
+        assert parse_timestamp("2025-07-27T17:30:13+01:00") == parse_timestamp(
+            "2025-07-27T16:30:13Z"
+        )
+
+    def test_long_fractional_seconds(self) -> None:
+        assert parse_timestamp("2025-07-27T16:22:51.9148699Z") is not None
+
+    def test_invalid_returns_none(self) -> None:
+        assert parse_timestamp("") is None
+        assert parse_timestamp("not a time") is None
+
+
 class TestTfLDataUrl:
     def test_tube_uses_arrivals_url(self) -> None:
         tfl = TfLData(method="tube", line="jubilee", station="940GZZLUSTD")
@@ -384,6 +433,39 @@ class TestTimetableMerging:
         assert len(matched) == 1
 
 
+class TestMergeRealtimeWithSchedule:
+    def test_two_predictions_near_one_scheduled_both_match(self) -> None:
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        tfl.populate(
+            [_make_realtime_entry(9), _make_realtime_entry(11)], filter_platform="241"
+        )
+        tfl.sort_data(5)
+        tfl.set_timetable(_make_timetable("490000000X", [10]))
+        departures = tfl.get_departures()
+        assert [d["prediction_type"] for d in departures] == ["scheduled+realtime"] * 2
+
+    def test_matches_earliest_scheduled_within_window(self) -> None:
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        tfl.populate([_make_realtime_entry(11)], filter_platform="241")
+        tfl.sort_data(5)
+        tfl.set_timetable(_make_timetable("490000000X", [10, 12]))
+        departures = tfl.get_departures()
+        types = [d["prediction_type"] for d in departures]
+        assert types == ["scheduled+realtime", "scheduled"]
+
+    def test_interleaves_realtime_and_scheduled(self) -> None:
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        tfl.populate(
+            [_make_realtime_entry(5), _make_realtime_entry(25)], filter_platform="241"
+        )
+        tfl.sort_data(5)
+        tfl.set_timetable(_make_timetable("490000000X", [15, 35]))
+        departures = tfl.get_departures()
+        assert [d["prediction_type"] for d in departures] == [
+            "realtime", "scheduled", "realtime", "scheduled",
+        ]
+
+
 class TestDeparturesModeFilter:
     def _make_tfl_with_mixed(self) -> TfLData:
         """TfLData with one realtime-only, one scheduled+realtime, one scheduled-only departure."""
@@ -0,0 +1,293 @@
+import json
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from custom_components.london_tfl.timetable import (
+    CompiledTimetable,
+    compile_timetable,
+    schedule_name,
+)
+
+FIXTURES = Path(__file__).parent.parent / "custom_components" / "london_tfl" / "test"
+LONDON = ZoneInfo("Europe/London")
+
+
+@pytest.fixture
+def raw_timetable() -> dict:
+    return json.loads((FIXTURES / "timetable_490002290ZZ.json").read_text())
+
+
+class TestCompileTimetable:
+    def test_departure_stop_has_no_offset(self, raw_timetable: dict) -> None:
+        compiled = compile_timetable(raw_timetable, "490002298ZZ")
+        journeys = raw_timetable["timetable"]["routes"][0]["schedules"][0][
+            "knownJourneys"
+        ]
+        first = min(int(j["hour"]) * 60 + int(j["minute"]) for j in journeys)
+        assert compiled.schedules["Monday to Friday"][0] == first
+        assert compiled.towards == "Prince Regent & Custom House"
+
+    def test_interval_offset_applied(self, raw_timetable: dict) -> None:
+        origin = compile_timetable(raw_timetable, "490002298ZZ")
+        downstream = compile_timetable(raw_timetable, "490009438E")
+        assert downstream.schedules["Saturday"] == [
+            m + 2.0 for m in origin.schedules["Saturday"]
+        ]
+        assert downstream.towards == "Custom House"
+
+    def test_schedules_sorted(self, raw_timetable: dict) -> None:
+        compiled = compile_timetable(raw_timetable, "490002298ZZ")
+        for minutes in compiled.schedules.values():
+            assert minutes == sorted(minutes)
+        assert set(compiled.schedules) == {"Monday to Friday", "Saturday", "Sunday"}
+
+    def test_no_routes_returns_none(self) -> None:
+        assert compile_timetable({}, "490002298ZZ") is None
+
+    BRANCHES = {
+        "timetable": {
+            "departureStopId": "A",
+            "routes": [
+                {
+                    "stationIntervals": [
+                        {"id": "0", "intervals": [{"stopId": "B", "timeToArrival": 5}]},
+                        {"id": "1", "intervals": [{"stopId": "C", "timeToArrival": 3}]},
+                    ],
+                    "schedules": [
+                        {
+                            "name": "Saturday",
+                            "knownJourneys": [
+                                {"hour": "10", "minute": "0", "intervalId": 0},
+                                {"hour": "10", "minute": "2", "intervalId": 1},
+                            ],
+                        }
+                    ],
+                }
+            ],
+        }
+    }
+
+    @pytest.mark.parametrize(
+        "station,expected", [("A", [600, 602]), ("B", [605]), ("C", [605])]
+    )
+    def test_journeys_follow_their_interval(self, station: str, expected: list) -> None:
+        assert compile_timetable(self.BRANCHES, station).schedules == {
+            "Saturday": expected
+        }
+
+    def test_interval_without_time_skipped(self) -> None:
+        timetable = json.loads(json.dumps(self.BRANCHES))
+        route = timetable["timetable"]["routes"][0]
+        route["stationIntervals"][0]["intervals"][0]["timeToArrival"] = None
+        assert compile_timetable(timetable, "B").schedules == {"Saturday": []}
+        assert compile_timetable(timetable, "C").schedules == {"Saturday": [605]}
+
+
+class TestScheduleName:
+    @pytest.mark.parametrize(
+        "day,expected",
+        [
+            (datetime(2025, 7, 28, 12, tzinfo=LONDON), "Monday to Friday"),
+            (datetime(2025, 8, 1, 12, tzinfo=LONDON), "Monday to Friday"),
+            (datetime(2025, 8, 2, 12, tzinfo=LONDON), "Saturday"),
+            (datetime(2025, 8, 3, 12, tzinfo=LONDON), "Sunday"),
+        ],
+    )
+    def test_day_types(self, day: datetime, expected: str) -> None:
+        assert schedule_name(day) == expected
+
+
+class TestDeparturesBetween:
+    def test_window_lookup(self) -> None:
+        now = datetime(2025, 7, 28, 12, 0, tzinfo=LONDON)
+        compiled = CompiledTimetable(
+            towards="Stratford",
+            schedules={"Monday to Friday": [600, 719, 721, 750, 781, 900]},
+        )
+        ts = now.timestamp()
+        result = compiled.departures_between(now, ts - 60, ts + 3600)
+        assert [dt.astimezone(LONDON).strftime("%H:%M") for dt, _ in result] == [
+            "11:59",
+            "12:01",
+            "12:30",
+        ]
+        assert all(towards == "Stratford" for _, towards in result)
+        assert all(dt.tzinfo == UTC for dt, _ in result)
+
+    def test_minutes_past_midnight_roll_over(self) -> None:
+        now = datetime(2025, 7, 28, 23, 50, tzinfo=LONDON)
+        compiled = CompiledTimetable(
+            towards="", schedules={"Monday to Friday": [24 * 60 + 10]}
+        )
+        ts = now.timestamp()
+        ((dt, _),) = compiled.departures_between(now, ts, ts + 3600)
+        assert dt - now.astimezone(UTC) == timedelta(minutes=20)
+
+    def test_falls_back_to_first_schedule(self) -> None:
+        now = datetime(2025, 8, 3, 12, 0, tzinfo=LONDON)
+        compiled = CompiledTimetable(towards="", schedules={"Monday to Friday": [730]})
+        ts = now.timestamp()
+        assert len(compiled.departures_between(now, ts, ts + 3600)) == 1
+
+
+class TestTimetableStore:
+    async def test_stored_timetable_loaded_without_network(
+        self, hass, hass_storage
+    ) -> None:
+        from custom_components.london_tfl.const import DATA_TIMETABLES
+        from custom_components.london_tfl.tfl_data import TfLData
+        from custom_components.london_tfl.timetable import (
+            STORAGE_KEY,
+            async_setup_timetable_store,
+        )
+
+        hass_storage[STORAGE_KEY] = {
+            "version": 1,
+            "key": STORAGE_KEY,
+            "data": {
+                "timetables": {
+                    "241/490000000X": {
+                        "fetched": time.time() - 3600,
+                        "timetable": {
+                            "towards": "Stratford",
+                            "schedules": {"Sunday": [600.0]},
+                        },
+                    },
+                    "241/490000000Y": {
+                        "fetched": time.time() - 4 * 24 * 3600,
+                        "timetable": {
+                            "towards": "Stratford",
+                            "schedules": {"Sunday": [600.0]},
+                        },
+                    },
+                }
+            },
+        }
+        store = await async_setup_timetable_store(hass)
+        assert hass.data[DATA_TIMETABLES] is store
+        assert store.get("241", "490000000Y") is None
+
+        tfl = TfLData(method="bus", line="241", station="490000000X")
+        # A network request here would fail under pytest-socket.
+        assert await tfl.fetch_timetable(hass)
+        assert tfl._timetable.towards == "Stratford"
+
+    async def test_put_round_trips(self, hass, hass_storage) -> None:
+        from custom_components.london_tfl.timetable import TimetableStore
+
+        store = TimetableStore(hass)
+        await store.async_load()
+        compiled = CompiledTimetable(towards="Bow", schedules={"Saturday": [1.0, 2.0]})
+        store.put("dlr", "940GZZDLBOW", compiled, 1000.0)
+        assert store.get("dlr", "940GZZDLBOW") == (compiled, 1000.0)
+        assert (
+            store._data_to_save()["timetables"]["dlr/940GZZDLBOW"]["fetched"] == 1000.0
+        )
+
+
+class TestRouteTimetables:
+    def test_serves_departure_stop_and_later_stops(self, raw_timetable: dict) -> None:
+        from custom_components.london_tfl.timetable import serves_station
+
+        assert serves_station(raw_timetable, "490002298ZZ")
+        assert serves_station(raw_timetable, "490009438E")
+        assert not serves_station(raw_timetable, "490000000X")
+        assert not serves_station({}, "490002298ZZ")
+
+    def test_interval_without_time_does_not_serve(self, raw_timetable: dict) -> None:
+        from custom_components.london_tfl.timetable import serves_station
+
+        route = raw_timetable["timetable"]["routes"][0]
+        for interval in route["stationIntervals"][0]["intervals"]:
+            if interval["stopId"] == "490009438E":
+                interval["timeToArrival"] = None
+        assert not serves_station(raw_timetable, "490009438E")
+
+    async def test_route_found_for_later_station(
+        self, hass, raw_timetable: dict
+    ) -> None:
+        from custom_components.london_tfl.timetable import TimetableStore
+
+        store = TimetableStore(hass)
+        store.add_route("241", raw_timetable, 1000.0)
+        assert store.route_for("241", "490009438E") is None  # too old
+        store.add_route("241", raw_timetable, time.time())
+        assert store.route_for("241", "490009438E")[0] is raw_timetable
+        assert len(store._routes["241"]) == 1
+        assert store.route_for("25", "490009438E") is None
+
+    async def test_stations_on_a_route_share_one_download(
+        self, hass, raw_timetable: dict, monkeypatch
+    ) -> None:
+        from custom_components.london_tfl import tfl_data
+        from custom_components.london_tfl.timetable import async_setup_timetable_store
+
+        requested = []
+
+        async def fake_request(url, **kwargs):
+            requested.append(url)
+            return json.dumps(raw_timetable)
+
+        monkeypatch.setattr(tfl_data, "request", fake_request)
+        await async_setup_timetable_store(hass)
+        stops = [
+            tfl_data.TfLData(method="bus", line="241", station=station)
+            for station in ("490002298ZZ", "490009438E", "490013206E")
+        ]
+        for stop in stops:
+            assert await stop.fetch_timetable(hass)
+
+        assert len(requested) == 1
+        assert stops[1]._timetable == compile_timetable(raw_timetable, "490009438E")
+        assert stops[1]._timetable.schedules != stops[0]._timetable.schedules
+
+    async def test_forced_refresh_downloads_again(
+        self, hass, raw_timetable: dict, monkeypatch
+    ) -> None:
+        from custom_components.london_tfl import tfl_data
+        from custom_components.london_tfl.timetable import async_setup_timetable_store
+
+        requested = []
+
+        async def fake_request(url, **kwargs):
+            requested.append(url)
+            return json.dumps(raw_timetable)
+
+        monkeypatch.setattr(tfl_data, "request", fake_request)
+        await async_setup_timetable_store(hass)
+        stop = tfl_data.TfLData(method="bus", line="241", station="490009438E")
+        await tfl_data.TfLData(
+            method="bus", line="241", station="490002298ZZ"
+        ).fetch_timetable(hass)
+        await stop.fetch_timetable(hass, force=True)
+        assert len(requested) == 2
+
+
+class TestNextDeparture:
+    def test_later_today(self) -> None:
+        now = datetime(2025, 7, 28, 12, 0, tzinfo=LONDON)
+        compiled = CompiledTimetable(
+            towards="", schedules={"Monday to Friday": [600, 800]}
+        )
+        assert (
+            compiled.next_departure(now)
+            == datetime(2025, 7, 28, 13, 20, tzinfo=LONDON).timestamp()
+        )
+
+    def test_rolls_over_to_tomorrow(self) -> None:
+        now = datetime(2025, 8, 1, 23, 0, tzinfo=LONDON)
+        compiled = CompiledTimetable(
+            towards="", schedules={"Monday to Friday": [600], "Saturday": [420]}
+        )
+        assert (
+            compiled.next_departure(now)
+            == datetime(2025, 8, 2, 7, 0, tzinfo=LONDON).timestamp()
+        )
+
+    def test_empty_schedule(self) -> None:
+        now = datetime(2025, 7, 28, 12, 0, tzinfo=LONDON)
+        assert CompiledTimetable(towards="", schedules={}).next_departure(now) is None